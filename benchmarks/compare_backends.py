@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Markdown Backend Comparison
+Checks every markdown backend of convert_readme_to_html.py against the golden
+HTML in backend_corpus/ and times the backends on the corpus, a large
+synthetic document and any README files given on the command line
+
+The corpus covers what the READMEs rely on: fenced code, tables, line breaks,
+raw <img> tags, headings and links, and the places where CommonMark differs
+from Python-Markdown: list rules, fences Python-Markdown does not accept,
+escaped pipes in table code, tag lines followed by text or a fence, markdown
+inside <details> and setext headings of several lines
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+import time
+from html.parser import HTMLParser
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "readme_manager_html_detailed"))
+
+import convert_readme_to_html
+from run_benchmarks import sections
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend_corpus")
+REFERENCE_BACKEND = convert_readme_to_html.PythonMarkdownBackend.name
+
+# Reduces HTML to what a browser renders: tags with sorted attributes and text with
+# whitespace collapsed outside <pre>, so formatting-only differences are ignored
+class HTMLNormalizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.tokens = []
+        self.pre_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        self.tokens.append(("start", tag, tuple(sorted(attrs))))
+        if tag == "pre":
+            self.pre_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.tokens.append(("start", tag, tuple(sorted(attrs))))
+
+    def handle_endtag(self, tag):
+        self.tokens.append(("end", tag))
+        if tag == "pre":
+            self.pre_depth = max(0, self.pre_depth - 1)
+
+    def handle_data(self, data):
+        if self.tokens and self.tokens[-1][0] == "text":
+            data = self.tokens.pop()[1] + data
+        self.tokens.append(("text", data, self.pre_depth > 0))
+
+    def handle_comment(self, data):
+        self.tokens.append(("comment", data))
+
+# Function to normalize HTML into a list of tokens, dropping whitespace that does not render
+def normalize(html_text):
+    normalizer = HTMLNormalizer()
+    normalizer.feed(html_text)
+    normalizer.close()
+    tokens = []
+    for token in normalizer.tokens:
+        if token[0] == "text":
+            text, in_pre = token[1], token[2]
+            if in_pre:
+                # Trailing spaces in code do not render, Python-Markdown blanks whitespace-only lines
+                text = re.sub(r"[ \t]+\n", "\n", text)
+            else:
+                text = re.sub(r"\s+", " ", text).strip()
+            if text:
+                tokens.append(("text", text))
+        else:
+            tokens.append(token)
+    return tokens
+
+# Function to describe the first difference between two normalized documents
+def first_difference(expected, actual):
+    for index, (left, right) in enumerate(zip(expected, actual)):
+        if left != right:
+            return f"token {index}: expected {left!r}, got {right!r}"
+    return f"expected {len(expected)} tokens, got {len(actual)}"
+
+# Function to create every backend whose dependencies are installed
+def available_backends():
+    backends = {}
+    for name in convert_readme_to_html.MARKDOWN_BACKENDS:
+        try:
+            backends[name] = convert_readme_to_html.create_backend(name)
+        except ImportError as error:
+            print(f"Skipping {name}: {error}")
+    return backends
+
+# Function to check each corpus case: the reference backend must reproduce the golden file
+# exactly, the other backends must render the same normalized HTML
+def check_corpus(backends, update_golden):
+    failures = []
+    for markdown_file in sorted(glob.glob(os.path.join(CORPUS_DIR, "*.md"))):
+        case = os.path.splitext(os.path.basename(markdown_file))[0]
+        golden_file = os.path.splitext(markdown_file)[0] + ".html"
+        with open(markdown_file, "r") as file:
+            text = file.read()
+
+        if update_golden:
+            with open(golden_file, "w") as file:
+                file.write(backends[REFERENCE_BACKEND].convert(text) + "\n")
+        with open(golden_file, "r") as file:
+            golden = file.read()
+
+        for name, backend in backends.items():
+            output = backend.convert(text)
+            if name == REFERENCE_BACKEND:
+                equal = output + "\n" == golden
+                detail = "output differs from the golden file"
+            else:
+                expected, actual = normalize(golden), normalize(output)
+                equal = expected == actual
+                detail = "" if equal else first_difference(expected, actual)
+            print(f"{'✓' if equal else '✗'} {case:<22} {name}")
+            if not equal:
+                failures.append(f"{case} ({name}): {detail}")
+    return failures
+
+# Function to time each backend converting a document, keeping the fastest of several runs
+def time_backends(backends, text, repeat):
+    timings = {}
+    for name, backend in backends.items():
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            backend.convert(text)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+    return timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check markdown backends against the golden corpus and time them")
+    parser.add_argument("readme_files", nargs="*", help="Additional markdown files to compare and time (e.g. a generated README.md)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per document, the fastest is kept")
+    parser.add_argument("--update-golden", action="store_true", help=f"Regenerate the golden HTML with the {REFERENCE_BACKEND} backend")
+    args = parser.parse_args(argv)
+
+    backends = available_backends()
+    failures = check_corpus(backends, args.update_golden)
+
+    documents = {"synthetic (800 sections)": sections(800), "corpus": ""}
+    for markdown_file in sorted(glob.glob(os.path.join(CORPUS_DIR, "*.md"))):
+        with open(markdown_file, "r") as file:
+            documents["corpus"] += file.read() + "\n\n"
+    for readme_file in args.readme_files:
+        with open(readme_file, "r") as file:
+            documents[readme_file] = convert_readme_to_html.rewrite_markdown(file.read(), start_path=os.path.dirname(os.path.abspath(readme_file)))
+
+    print()
+    print(f"{'Document':<32}" + "".join(f"{name:>18}" for name in backends) + "   Equivalent")
+    for document, text in documents.items():
+        timings = time_backends(backends, text, args.repeat)
+        reference = normalize(backends[REFERENCE_BACKEND].convert(text))
+        equivalent = all(normalize(backend.convert(text)) == reference for backend in backends.values())
+        print(f"{document[-32:]:<32}" + "".join(f"{timings[name] * 1000:>15.1f} ms" for name in backends) + f"   {'yes' if equivalent else 'no'}")
+
+    for failure in failures:
+        print(f"✗ {failure}")
+    if failures:
+        return 1
+    print("✓ All backends match the golden corpus")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+README Pipeline Benchmarks
+Times README expansion and HTML conversion on synthetic workloads and
+compares the results with a stored baseline
+
+Each case is also timed relative to a reference workload run right before
+it, which does not use the code under test. The gate compares these relative
+timings, so a baseline recorded on one machine holds on a faster or busier
+one. Absolute seconds are kept for reading. Regenerate the baseline with
+--update-baseline when a change is meant to alter performance
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "readme_manager_html_detailed"))
+
+import readme_updater
+import convert_readme_to_html
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# A paragraph of markdown resembling the deployment guides
+SECTION = """### Step {index}: Configure service {index}
+
+Run the following commands on the server and check the output.
+
+```bash
+sudo systemctl restart service-{index}
+curl -s http://localhost:{port}/health | jq .
+```
+
+| Setting | Value |
+|---------|-------|
+| port    | {port} |
+| user    | svc{index} |
+
+"""
+
+# Serves a fixed set of documents with a configurable delay per request
+class StubServer:
+    def __init__(self, documents, latency=0.0):
+        self.documents = documents
+        self.latency = latency
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                time.sleep(stub.latency)
+                body = stub.documents.get(self.path)
+                if body is None:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+def sections(count, start=0):
+    return "".join(SECTION.format(index=index, port=8000 + index) for index in range(start, start + count))
+
+# Workload: one base document including many small remote files
+def wide_fanout(width=70):
+    documents = {f"/wide_{index}.md": sections(2, index) for index in range(width)}
+    include_map = {f"WIDE {index}": f"/wide_{index}.md" for index in range(width)}
+    base = "\n\n".join(f"## Part {index}\n\n[WIDE {index}]" for index in range(width))
+    return base, include_map, documents
+
+# Workload: a chain of includes, each one nesting the next
+def deep_nesting(depth=25):
+    documents = {f"/deep_{index}.md": sections(1, index) + (f"[DEEP {index + 1}]" if index + 1 < depth else "") for index in range(depth)}
+    include_map = {f"DEEP {index}": f"/deep_{index}.md" for index in range(depth)}
+    return "# Deep\n\n[DEEP 0]\n", include_map, documents
+
+# Workload: a single very large include
+def large_include(size_sections=4000):
+    documents = {"/large.md": sections(size_sections)}
+    return "# Large\n\n[LARGE]\n\n[LARGE]\n", {"LARGE": "/large.md"}, documents
+
+# Workload: markdown dominated by image links, for the HTML conversion stage
+def image_heavy(images=2000):
+    lines = []
+    for index in range(images):
+        if index % 2:
+            lines.append(f"![Screenshot {index}](https://github.com/arpansahu/common_readme/blob/main/Images/shot_{index}.png)")
+        else:
+            lines.append(f"![Diagram {index}](https://example.com/images/diagram_{index}.png)")
+        lines.append("")
+        lines.append(f"Figure {index} shows the state after step {index}.")
+        lines.append("")
+    return "\n".join(lines) + sections(50)
+
+# Function to serve a workload from a stub server, returning the base document and its include map
+def serve(workload, latency, stack):
+    base, include_map, documents = workload
+    stub = stack.enter_context(StubServer(documents, latency))
+    return base, {placeholder: stub.url + path for placeholder, path in include_map.items()}
+
+# Function to expand a served workload with the include cache disabled
+def expand(base, sources):
+    with contextlib.redirect_stdout(io.StringIO()):
+        content = readme_updater.include_file_content(base, sources)
+    if content is None:
+        raise RuntimeError("Expansion failed, an include could not be fetched")
+    return content
+
+# Function to convert markdown to HTML through the converter's file based entry point
+def convert(markdown_text):
+    with tempfile.TemporaryDirectory() as work_dir:
+        input_file = os.path.join(work_dir, "README.md")
+        with open(input_file, "w") as readme:
+            readme.write(markdown_text)
+        with contextlib.redirect_stdout(io.StringIO()):
+            convert_readme_to_html.process_markdown_to_html(
+                input_file, os.path.join(work_dir, "readme.html")
+            )
+
+# Least total time each case and the reference workload are run for, and the most runs of a case
+MIN_MEASURE_SECONDS = 0.5
+MAX_RUNS = 100
+
+# Text for the reference workload, and its plain Python word count over it
+REFERENCE_TEXT = sections(1500)
+WORD_PATTERN = re.compile(r"\w+")
+
+# Function to run the reference workload: regex, string and dict work like the cases do, but
+# none of the code being benchmarked, so only the speed of the machine changes its time
+def reference():
+    counts = {}
+    for word in WORD_PATTERN.findall(REFERENCE_TEXT):
+        word = word.lower()
+        counts[word] = counts.get(word, 0) + 1
+    return json.loads(json.dumps(sorted(counts.items())))
+
+def measure_seconds(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+# Function to measure the best wall time over several runs, alternating with the reference workload
+# so both see the same load, the time relative to the reference, and the peak traced memory of one run.
+# Short cases run more often, until each side has run for MIN_MEASURE_SECONDS
+def measure(function, repeat):
+    timings = []
+    reference_timings = []
+    while len(timings) < repeat or (min(sum(timings), sum(reference_timings)) < MIN_MEASURE_SECONDS and len(timings) < MAX_RUNS):
+        reference_timings.append(measure_seconds(reference))
+        timings.append(measure_seconds(function))
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    seconds = min(timings)
+    return {"seconds": round(seconds, 6), "relative": round(seconds / min(reference_timings), 3), "peak_kb": round(peak / 1024, 1)}
+
+def build_cases(latency, stack):
+    wide = serve(wide_fanout(), latency, stack)
+    deep = serve(deep_nesting(), latency, stack)
+    large = serve(large_include(), latency, stack)
+    images = image_heavy()
+    large_markdown = sections(800)
+    return {
+        "expand_wide_fanout": lambda: expand(*wide),
+        "expand_deep_nesting": lambda: expand(*deep),
+        "expand_large_include": lambda: expand(*large),
+        "html_image_heavy": lambda: convert(images),
+        "html_large_document": lambda: convert(large_markdown),
+    }
+
+# Function to compare results with the baseline, returning the list of regressions. Time is
+# compared relative to the reference workload; a baseline without relative timings compares seconds
+def find_regressions(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for metric in ("relative" if "relative" in expected else "seconds", "peak_kb"):
+            if result[metric] > expected[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {result[metric]} > baseline {expected[metric]} (+{tolerance:.0%})")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark README expansion and HTML conversion")
+    parser.add_argument("--latency", type=float, default=0.005, help="Delay in seconds the stub server adds to every request")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case and of the reference workload, the fastest is kept")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown or memory growth over the baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline results file")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--only", action="append", help="Run only the named case (repeatable)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with contextlib.ExitStack() as stack:
+        for name, function in build_cases(args.latency, stack).items():
+            if args.only and name not in args.only:
+                continue
+            results[name] = measure(function, args.repeat)
+            print(f"{name:<24} {results[name]['seconds'] * 1000:>10.1f} ms {results[name]['relative']:>8.2f}x reference {results[name]['peak_kb']:>12.1f} KB peak")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+            baseline_file.write("\n")
+        print(f"Baseline has been written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --update-baseline to create one")
+        return 0
+    with open(args.baseline, "r") as baseline_file:
+        regressions = find_regressions(results, json.load(baseline_file), args.tolerance)
+    for regression in regressions:
+        print(f"✗ Regression: {regression}")
+    if regressions:
+        return 1
+    print("✓ No regressions against the baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
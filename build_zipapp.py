@@ -0,0 +1,124 @@
+import argparse
+import fcntl
+import glob
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipapp
+
+# The renderer and the HTML converter, bundled with their pure Python dependencies into one archive
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+HTML_CONVERTER_DIR = os.path.join(SCRIPT_DIR, "readme_manager_html_detailed")
+SOURCE_FILES = [
+    os.path.join(SCRIPT_DIR, "readme_updater.py"),
+    os.path.join(SCRIPT_DIR, "include_files.py"),
+    os.path.join(SCRIPT_DIR, "baseREADME.md"),
+    os.path.join(HTML_CONVERTER_DIR, "convert_readme_to_html.py"),
+    os.path.join(HTML_CONVERTER_DIR, "precompress_html.py"),
+    os.path.join(HTML_CONVERTER_DIR, "merge_search_index.py"),
+]
+REQUIREMENTS_FILES = [
+    os.path.join(SCRIPT_DIR, "requirements.txt"),
+    os.path.join(HTML_CONVERTER_DIR, "requirements.txt"),
+]
+
+# Built archives are kept next to the other caches of the fleet, one file per version
+ARTIFACT_DIR = os.path.join(os.environ.get("README_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "common_readme")), "artifacts")
+ARTIFACT_PREFIX = "fleet_tools-"
+ARTIFACT_MAX_AGE = 7 * 24 * 60 * 60
+
+# Entry point of the archive: the first argument picks the bundled script to run
+MAIN_TEMPLATE = '''import runpy
+import sys
+
+VERSION = "{version}"
+
+# Commands of the archive and the bundled script each one runs
+COMMANDS = {{
+    "render": "readme_updater",
+    "convert": "convert_readme_to_html",
+    "precompress": "precompress_html",
+    "merge-index": "merge_search_index",
+}}
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--version":
+        print(VERSION)
+        sys.exit(0)
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+        print("usage: " + sys.argv[0] + " <" + "|".join(COMMANDS) + "> [arguments] | --version")
+        sys.exit(2)
+    command = sys.argv.pop(1)
+    sys.argv[0] = sys.argv[0] + " " + command
+    runpy.run_module(COMMANDS[command], run_name="__main__", alter_sys=True)
+'''
+
+# Function to derive the archive version from everything that goes into it: the sources,
+# the pinned requirements and the Python version the dependencies are resolved for
+def artifact_version(python_version=None):
+    digest = hashlib.sha256((python_version or f"{sys.version_info.major}.{sys.version_info.minor}").encode("utf-8"))
+    for path in SOURCE_FILES + REQUIREMENTS_FILES:
+        digest.update(os.path.relpath(path, SCRIPT_DIR).encode("utf-8") + b"\0")
+        with open(path, "rb") as file:
+            digest.update(file.read() + b"\0")
+    return digest.hexdigest()[:12]
+
+def artifact_path(artifact_dir=ARTIFACT_DIR, version=None):
+    return os.path.join(artifact_dir, f"{ARTIFACT_PREFIX}{version or artifact_version()}.pyz")
+
+# Function to install the requirements into a directory. Only pure Python wheels are accepted,
+# because compiled extensions cannot be imported from inside a zip archive
+def install_requirements(target_dir, python_version):
+    command = [
+        sys.executable, "-m", "pip", "install", "--quiet", "--disable-pip-version-check", "--no-compile",
+        "--target", target_dir, "--only-binary=:all:", "--implementation", "py", "--abi", "none",
+        "--platform", "any", "--python-version", python_version,
+    ]
+    for requirements_file in REQUIREMENTS_FILES:
+        command += ["-r", requirements_file]
+    subprocess.run(command, check=True)
+    shutil.rmtree(os.path.join(target_dir, "bin"), ignore_errors=True)
+
+# Function to build the archive for this checkout unless that version was built before, returning
+# its path. A lock file keeps concurrent builds from racing, and the archive appears atomically
+def build_artifact(artifact_dir=ARTIFACT_DIR):
+    python_version = f"{sys.version_info.major}.{sys.version_info.minor}"
+    version = artifact_version(python_version)
+    target = artifact_path(artifact_dir, version)
+    os.makedirs(artifact_dir, exist_ok=True)
+    with open(os.path.join(artifact_dir, ".build.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.exists(target):
+            return target
+
+        print(f"Building {target}")
+        with tempfile.TemporaryDirectory(prefix="fleet-tools-") as staging:
+            install_requirements(staging, python_version)
+            for path in SOURCE_FILES:
+                shutil.copy(path, staging)
+            with open(os.path.join(staging, "__main__.py"), "w") as file:
+                file.write(MAIN_TEMPLATE.format(version=version))
+            temp_file = os.path.join(artifact_dir, f".{os.path.basename(target)}.tmp")
+            zipapp.create_archive(staging, temp_file, interpreter="/usr/bin/env python3", compressed=True)
+            os.replace(temp_file, target)
+
+        # Drop versions nobody has built for a while; a run of another checkout may still use recent ones
+        for old_artifact in glob.glob(os.path.join(artifact_dir, f"{ARTIFACT_PREFIX}*.pyz")):
+            if old_artifact != target and time.time() - os.path.getmtime(old_artifact) > ARTIFACT_MAX_AGE:
+                os.remove(old_artifact)
+    return target
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bundle readme_updater.py and the HTML converter with their dependencies into one zipapp")
+    parser.add_argument("--artifact-dir", default=ARTIFACT_DIR, help="Directory keeping the built archives (default: %(default)s)")
+    parser.add_argument("--print-path", action="store_true", help="Only print where the archive of this checkout is, without building it")
+    args = parser.parse_args()
+
+    if args.print_path:
+        print(artifact_path(args.artifact_dir))
+    else:
+        print(f"Zipapp is ready: {build_artifact(args.artifact_dir)}")
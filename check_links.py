@@ -0,0 +1,208 @@
+import requests
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+from include_files import include_files
+from readme_updater import CACHE_DIR, FAILED_EXIT_CODE, FETCH_TIMEOUT, create_session, project_slots, resolve_project_includes
+
+# Defaults for the link checker: results stay valid for a few hours, checks run wide in parallel
+LINK_CACHE_FILE = os.path.join(CACHE_DIR, "links.json")
+LINK_CACHE_TTL = 6 * 60 * 60
+CHECK_WORKERS = 32
+
+# Image references in markdown: ![alt](url "title") and raw <img src="url"> tags
+IMAGE_PATTERN = re.compile(r'!\[[^\]]*\]\(\s*<?([^)\s>]+)>?(?:\s+"[^"]*")?\s*\)|<img\b[^>]*?\bsrc=["\']([^"\']+)["\']', re.IGNORECASE)
+FENCE_PATTERN = re.compile(r"^\s*(```|~~~)")
+
+# Results of earlier link checks keyed by URL. Working links are trusted for ttl seconds and
+# then revalidated with a conditional request; broken links are always checked again
+class LinkCache:
+    def __init__(self, cache_file=LINK_CACHE_FILE, ttl=LINK_CACHE_TTL):
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        try:
+            with open(cache_file, "r") as file:
+                self.entries = json.load(file)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def lookup(self, url):
+        with self.lock:
+            return self.entries.get(url)
+
+    def is_fresh(self, entry):
+        return entry["ok"] and time.time() - entry["checked_at"] < self.ttl
+
+    def store(self, url, result):
+        with self.lock:
+            self.entries[url] = result
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.cache_file)), exist_ok=True)
+        with self.lock:
+            temp_file = self.cache_file + ".tmp"
+            with open(temp_file, "w") as file:
+                json.dump(self.entries, file)
+            os.replace(temp_file, self.cache_file)
+
+# Function to list include targets as (target, source) pairs: the common includes, or with a
+# project root the project-relative includes resolved against it
+def collect_include_links(include_map, root_dir=None):
+    slots = project_slots(include_map)
+    if root_dir is None:
+        return [(target, f"include [{placeholder}]") for placeholder, target in include_map.items() if placeholder not in slots]
+    resolved = resolve_project_includes(include_map, root_dir)
+    return [(resolved[placeholder], f"include [{placeholder}] of {root_dir}") for placeholder in include_map if placeholder in slots]
+
+# Function to list the images referenced by markdown files as (target, source) pairs,
+# ignoring code fences. Relative image paths are resolved against the markdown file
+def collect_image_links(markdown_files):
+    links = []
+    for markdown_file in markdown_files:
+        base_dir = os.path.dirname(os.path.abspath(markdown_file))
+        in_fence = False
+        with open(markdown_file, "r") as file:
+            for line_number, line in enumerate(file, 1):
+                if FENCE_PATTERN.match(line):
+                    in_fence = not in_fence
+                    continue
+                if in_fence:
+                    continue
+                for match in IMAGE_PATTERN.finditer(line):
+                    target = match.group(1) or match.group(2)
+                    if target.startswith(("data:", "#")):
+                        continue
+                    if not re.match(r"https?://", target):
+                        target = os.path.normpath(os.path.join(base_dir, unquote(target)))
+                    links.append((target, f"{markdown_file}:{line_number}"))
+    return links
+
+# Function to check one URL with a HEAD request, falling back to a streamed GET for servers that
+# refuse HEAD. A stale cached result is revalidated with If-None-Match / If-Modified-Since
+def check_url(url, session, cache=None, timeout=FETCH_TIMEOUT):
+    entry = cache.lookup(url) if cache is not None else None
+    if entry is not None and cache.is_fresh(entry):
+        return dict(entry, cached=True)
+
+    headers = {}
+    if entry is not None and entry["ok"]:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    try:
+        response = session.head(url, headers=headers, allow_redirects=True, timeout=timeout)
+        if response.status_code in (403, 405, 501):
+            response = session.get(url, headers=headers, allow_redirects=True, timeout=timeout, stream=True)
+            response.close()
+        status = response.status_code
+        result = {
+            "ok": status < 400,
+            "status": status,
+            "error": None if status < 400 else response.reason,
+            "etag": response.headers.get("ETag") or (entry or {}).get("etag"),
+            "last_modified": response.headers.get("Last-Modified") or (entry or {}).get("last_modified"),
+        }
+    except requests.RequestException as error:
+        result = {"ok": False, "status": None, "error": str(error), "etag": None, "last_modified": None}
+    result["checked_at"] = time.time()
+    if cache is not None:
+        cache.store(url, result)
+    return dict(result, cached=False)
+
+# Function to check a local include or image path
+def check_path(path):
+    exists = os.path.isfile(path)
+    return {"ok": exists, "status": None, "error": None if exists else "file not found", "cached": False}
+
+# Function to check every distinct target once, concurrently, returning the result per target
+def check_links(links, session, cache=None, max_workers=CHECK_WORKERS, timeout=FETCH_TIMEOUT):
+    targets = list(dict.fromkeys(target for target, _ in links))
+
+    def check(target):
+        if re.match(r"https?://", target):
+            return check_url(target, session, cache, timeout)
+        return check_path(target)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(targets, executor.map(check, targets)))
+
+# Function to build the report: one entry per target with its result and where it is referenced
+def build_report(links, results, seconds):
+    sources = {}
+    for target, source in links:
+        sources.setdefault(target, []).append(source)
+    entries = [
+        {"target": target, "ok": result["ok"], "status": result["status"], "error": result["error"], "cached": result["cached"], "sources": sources[target]}
+        for target, result in results.items()
+    ]
+    return {
+        "checked_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "seconds": round(seconds, 3),
+        "links": len(links),
+        "targets": len(entries),
+        "broken": sum(not entry["ok"] for entry in entries),
+        "cached": sum(entry["cached"] for entry in entries),
+        "results": entries,
+    }
+
+def print_report(report):
+    for entry in report["results"]:
+        if entry["ok"]:
+            continue
+        print(f"✗ {entry['status'] or '---'} {entry['target']}: {entry['error']}")
+        for source in entry["sources"]:
+            print(f"    referenced by {source}")
+    print(f"Checked {report['targets']} targets ({report['links']} references, {report['cached']} from cache) in {report['seconds']}s: {report['broken']} broken")
+
+# Function to parse the command line options
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check that every include target and every image referenced by the READMEs is reachable")
+    parser.add_argument("markdown_files", nargs="*", help="Markdown files whose images are checked (e.g. rendered README.md files)")
+    parser.add_argument("--root", action="append", default=[], help="Project root: check its project includes and the images of its README.md (repeatable)")
+    parser.add_argument("--cache-file", default=LINK_CACHE_FILE, help="File caching link check results")
+    parser.add_argument("--ttl", type=int, default=LINK_CACHE_TTL, help="Seconds a working link is trusted without checking it again")
+    parser.add_argument("--no-cache", action="store_true", help="Check every link, ignoring and not updating the cache")
+    parser.add_argument("--workers", type=int, default=CHECK_WORKERS, help="Concurrent requests")
+    parser.add_argument("--timeout", type=float, default=FETCH_TIMEOUT, help="Seconds to wait for each server")
+    parser.add_argument("--report", metavar="PATH", help="Also write the report as JSON to PATH")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    links = collect_include_links(include_files)
+    markdown_files = list(args.markdown_files)
+    for root_dir in args.root:
+        links.extend(collect_include_links(include_files, root_dir))
+        if os.path.isfile(os.path.join(root_dir, "README.md")):
+            markdown_files.append(os.path.join(root_dir, "README.md"))
+    links.extend(collect_image_links(markdown_files))
+
+    cache = None if args.no_cache else LinkCache(args.cache_file, args.ttl)
+    session = create_session(pool_size=args.workers)
+    start = time.perf_counter()
+    try:
+        results = check_links(links, session, cache, args.workers, args.timeout)
+    finally:
+        session.close()
+    if cache is not None:
+        cache.save()
+
+    report = build_report(links, results, time.perf_counter() - start)
+    print_report(report)
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+            report_file.write("\n")
+    return FAILED_EXIT_CODE if report["broken"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
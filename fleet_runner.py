@@ -0,0 +1,746 @@
+import argparse
+import fcntl
+import json
+import os
+import re
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import build_zipapp
+from include_files import include_files
+
+# Repositories are listed for all fleet jobs in repos_list.sh, next to this script
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOS_LIST_FILE = os.path.join(SCRIPT_DIR, "repos_list.sh")
+LOG_DIR = os.path.join(SCRIPT_DIR, "fleet_logs")
+
+# The HTML converter, precompression and search index merge run in process, imported from the
+# fleet zipapp or, without one, from this checkout
+HTML_CONVERTER_DIR = os.path.join(SCRIPT_DIR, "readme_manager_html_detailed")
+
+# Bare mirrors of the repositories live next to the include cache of readme_updater.py and are
+# kept between runs, so each run only fetches what changed. The state store remembers the inputs
+# of each repository's last successful run, so unchanged repositories are not even cloned
+CACHE_DIR = os.environ.get("README_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "common_readme"))
+MIRROR_DIR = os.path.join(CACHE_DIR, "mirrors")
+STATE_FILE = os.path.join(CACHE_DIR, "fleet_state.sqlite3")
+
+# The html stage of every repository shares one cache of converted README sections
+SECTION_CACHE_DIR = os.path.join(CACHE_DIR, "html_sections")
+
+# The repository whose scripts, templates and converter every stage uses
+COMMON_README_URL = "https://github.com/arpansahu/common_readme"
+COMMON_README_BRANCH = "main"
+
+# Remote includes are raw files of GitHub repositories, so a repository's branch head identifies them
+RAW_INCLUDE_PATTERN = re.compile(r"https://raw\.githubusercontent\.com/([^/]+)/([^/]+)/([^/]+)/")
+
+# Time allowed for each remote head lookup
+LS_REMOTE_TIMEOUT = 60
+
+# Defaults for the worker pool: repositories processed at once, and the time each one may take
+FLEET_WORKERS = 4
+REPO_TIMEOUT = 15 * 60
+
+# Stages run over each checkout, in this order
+STAGES = ("readme", "html", "wiki")
+
+# Per-repository README update script, and its exit status when README.md was left untouched
+UPDATE_SCRIPT_PATH = os.path.join("readme_manager", "update_readme.sh")
+LOCK_MANIFEST_PATH = os.path.join("readme_manager", "readme.lock.json")
+UNCHANGED_EXIT_CODE = 3
+
+# Repositories with this script get an HTML page on the portfolio
+HTML_SCRIPT_PATH = os.path.join("readme_manager_html_detailed", "convert_readme_to_html.sh")
+
+# Repositories with an introduction partial get its main version as their wiki's Home.md
+WIKI_INTRODUCTION_PATH = os.path.join("readme_manager", "partials", "introduction.md")
+WIKI_HOME_SOURCE_PATH = os.path.join("readme_manager", "partials", "introduction_main.md")
+
+# The portfolio site receiving every repository's readme.html, and where they go in it
+PORTFOLIO_URL = "https://github.com/arpansahu/arpansahu_dot_me"
+PORTFOLIO_PARTIALS_DIR = "templates/modules/project_detailed/project_partials"
+HTML_ARTIFACTS = ("readme.html", "readme.html.gz", "readme.html.br")
+
+# Paths the stages need from a repository, besides the files referenced by include_files.py
+SPARSE_PATHS = ["/readme_manager/", "/README.md", f"/{HTML_SCRIPT_PATH}"]
+
+# Final status of a stage: pushed a change, nothing to push, nothing to do, or failed. An html
+# stage is pending between the conversion and the batched portfolio update
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+SKIPPED = "skipped"
+FAILED = "failed"
+PENDING = "pending"
+
+# Raised when a command does not finish before its repository's deadline
+class CommandTimeout(Exception):
+    pass
+
+# Raised when a command a stage depends on exits with an error
+class CommandFailed(Exception):
+    pass
+
+# Function to read the repository URLs from the REPOS array of repos_list.sh
+def read_repos(repos_file=REPOS_LIST_FILE):
+    with open(repos_file, "r") as file:
+        content = file.read()
+    match = re.search(r"REPOS=\((.*?)\)", content, re.DOTALL)
+    if match is None:
+        return []
+    lines = [line.split("#", 1)[0] for line in match.group(1).splitlines()]
+    return re.findall(r'"([^"]+)"', "\n".join(lines))
+
+def repo_name(repo_url):
+    name = repo_url.rstrip("/").rsplit("/", 1)[-1]
+    return name[:-4] if name.endswith(".git") else name
+
+def strip_git_suffix(repo_url):
+    repo_url = repo_url.rstrip("/")
+    return repo_url[:-4] if repo_url.endswith(".git") else repo_url
+
+# Function to construct the authenticated URL for prod, plain URL for local. Other URLs,
+# such as local bare repositories, are used as they are
+def authenticated_url(repo_url, environment):
+    if environment != "local" and repo_url.startswith("https://github.com/") and os.environ.get("GIT_USERNAME"):
+        return f"https://{os.environ['GIT_USERNAME']}@github.com/{repo_url[len('https://github.com/'):]}"
+    return repo_url
+
+# Function to create the GIT_ASKPASS helper answering git's password prompts with $GIT_PASSWORD
+def create_askpass_helper(work_root):
+    helper = os.path.join(work_root, "git-askpass.sh")
+    with open(helper, "w") as file:
+        file.write('#!/bin/sh\necho "$GIT_PASSWORD"\n')
+    os.chmod(helper, 0o700)
+    return helper
+
+# Function to list the sparse checkout patterns: SPARSE_PATHS plus every project file that
+# include_files.py references relative to readme_manager/
+def sparse_paths(include_map=include_files):
+    paths = list(SPARSE_PATHS)
+    for file_url in include_map.values():
+        if file_url.startswith("http") or os.path.isabs(file_url):
+            continue
+        path = os.path.normpath(os.path.join("readme_manager", file_url))
+        if not path.startswith(("..", "readme_manager" + os.sep)) and f"/{path}" not in paths:
+            paths.append(f"/{path}")
+    return paths
+
+# Function to list the (repository URL, branch) pairs the remote includes are read from,
+# besides common_readme itself
+def include_sources(include_map=include_files):
+    sources = set()
+    for file_url in include_map.values():
+        match = RAW_INCLUDE_PATTERN.match(file_url)
+        if match is not None:
+            sources.add((f"https://github.com/{match.group(1)}/{match.group(2)}", match.group(3)))
+    sources.discard((COMMON_README_URL, COMMON_README_BRANCH))
+    return sorted(sources)
+
+# Function to look up the commit a remote ref points to with git ls-remote, None if it cannot be read
+def remote_head(url, env, ref="HEAD", timeout=LS_REMOTE_TIMEOUT):
+    try:
+        completed = subprocess.run(["git", "ls-remote", url, ref], env=env, stdin=subprocess.DEVNULL,
+                                   capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return None
+    if completed.returncode != 0:
+        return None
+    for line in completed.stdout.splitlines():
+        sha, _, name = line.partition("\t")
+        if name in (ref, f"refs/heads/{ref}"):
+            return sha
+    return None
+
+# Inputs of the last successful run of each stage of each repository: the repository's HEAD after
+# the run, the common_readme head and the heads of the other include sources
+class StateStore:
+    def __init__(self, state_file=STATE_FILE):
+        os.makedirs(os.path.dirname(os.path.abspath(state_file)), exist_ok=True)
+        self.connection = sqlite3.connect(state_file)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS stage_state ("
+            "repository TEXT NOT NULL, stage TEXT NOT NULL, repo_sha TEXT NOT NULL, common_readme_sha TEXT, "
+            "include_shas TEXT, updated_at REAL NOT NULL, PRIMARY KEY (repository, stage))"
+        )
+        self.connection.commit()
+
+    def load(self):
+        rows = self.connection.execute("SELECT repository, stage, repo_sha, common_readme_sha, include_shas FROM stage_state")
+        return {
+            (repository, stage): {"repo_sha": repo_sha, "common_readme_sha": common_readme_sha, "include_shas": json.loads(include_shas or "{}")}
+            for repository, stage, repo_sha, common_readme_sha, include_shas in rows
+        }
+
+    def record(self, repository, stage, inputs):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO stage_state VALUES (?, ?, ?, ?, ?, ?)",
+            (repository, stage, inputs["repo_sha"], inputs["common_readme_sha"], json.dumps(inputs["include_shas"], sort_keys=True), time.time()),
+        )
+
+    def forget(self, repository, stage=None):
+        if stage is None:
+            self.connection.execute("DELETE FROM stage_state WHERE repository = ?", (repository,))
+        else:
+            self.connection.execute("DELETE FROM stage_state WHERE repository = ? AND stage = ?", (repository, stage))
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+# Inputs each stage depends on: the README on everything it includes, the HTML on the README and
+# the converter in common_readme, the wiki only on the repository
+STAGE_INPUTS = {
+    "readme": ("repo_sha", "common_readme_sha", "include_shas"),
+    "html": ("repo_sha", "common_readme_sha"),
+    "wiki": ("repo_sha",),
+}
+
+# Function to check whether a stage already succeeded with the same inputs. Inputs that could not
+# be looked up never match, so the stage runs
+def stage_is_current(options, repo_url, stage, repo_sha):
+    previous = options.previous_state.get((repo_url, stage))
+    if options.force or previous is None:
+        return False
+    current = dict(options.remote_inputs, repo_sha=repo_sha)
+    for key in STAGE_INPUTS[stage]:
+        if current[key] is None or (key == "include_shas" and None in current[key].values()) or previous[key] != current[key]:
+            return False
+    return True
+
+# Function to measure the disk usage of a directory, used to report the bytes a fetch added
+def directory_size(path):
+    total = 0
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total += os.lstat(os.path.join(dir_path, file_name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+def format_bytes(size):
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+# Function to import a module of the HTML converter from the zipapp or the converter directory.
+# Outside the zipapp the converter needs the markdown package installed
+def load_converter_module(name, path=HTML_CONVERTER_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return __import__(name)
+
+# Outcome of processing one repository, for the summary table: a status and detail per stage.
+# Unverified stages succeeded without proof that they did their work, so they are not recorded
+class RepoResult:
+    def __init__(self, repo_url, name, stages, seconds=0.0, log_file=None, clone_seconds=0.0, fetched_bytes=0, repo_sha=None, unverified_stages=()):
+        self.repo_url = repo_url
+        self.name = name
+        self.stages = stages
+        self.unverified_stages = set(unverified_stages)
+        self.repo_sha = repo_sha
+        self.seconds = seconds
+        self.log_file = log_file
+        self.clone_seconds = clone_seconds
+        self.fetched_bytes = fetched_bytes
+
+    @property
+    def status(self):
+        statuses = [status for status, _ in self.stages.values()]
+        for status in (FAILED, CHANGED, PENDING, UNCHANGED):
+            if status in statuses:
+                return status
+        return SKIPPED
+
+    @property
+    def detail(self):
+        failures = [f"{stage}: {detail}" for stage, (status, detail) in self.stages.items() if status == FAILED]
+        return "; ".join(failures or [f"{stage}: {detail}" for stage, (_, detail) in self.stages.items() if detail])
+
+# One repository being processed: its own working directory, log file and deadline. A job over a
+# repository that is also processed in the same run, like the portfolio, needs its own name
+class RepoJob:
+    def __init__(self, repo_url, environment, work_root, log_dir, timeout, env, name=None):
+        self.repo_url = repo_url
+        self.name = name or repo_name(repo_url)
+        self.url = authenticated_url(repo_url, environment)
+        self.work_root = work_root
+        self.work_dir = os.path.join(work_root, self.name)
+        self.log_file = os.path.join(log_dir, f"{self.name}.log")
+        self.deadline = time.monotonic() + timeout
+        self.timeout = timeout
+        self.env = env
+        self.clone_seconds = 0.0
+        self.fetched_bytes = 0
+        self.unverified_stages = set()
+        self.log_handle = open(self.log_file, "w")
+
+    def log(self, message):
+        self.log_handle.write(f"{message}\n")
+        self.log_handle.flush()
+
+    # Run a command with its output in the repository log. The whole process group is killed when
+    # the repository's deadline passes, so hung git or pip children do not outlive it
+    def run(self, args, cwd=None, check=True):
+        self.log(f"$ {' '.join(args)}")
+        process = subprocess.Popen(
+            args, cwd=cwd or self.work_dir, env=self.env, stdin=subprocess.DEVNULL,
+            stdout=self.log_handle, stderr=subprocess.STDOUT, start_new_session=True,
+        )
+        try:
+            returncode = process.wait(timeout=max(0.0, self.deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+            raise CommandTimeout(f"timed out after {self.timeout}s running {args[0]} {args[1] if len(args) > 1 else ''}".rstrip())
+        if check and returncode != 0:
+            raise CommandFailed(f"{' '.join(args[:2])} exited with status {returncode}")
+        return returncode
+
+    # Run a command and return its output, logging only its errors
+    def read(self, args, cwd=None):
+        try:
+            completed = subprocess.run(
+                args, cwd=cwd or self.work_dir, env=self.env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                stderr=self.log_handle, text=True, timeout=max(0.0, self.deadline - time.monotonic()),
+            )
+        except subprocess.TimeoutExpired:
+            raise CommandTimeout(f"timed out after {self.timeout}s running {' '.join(args[:2])}")
+        if completed.returncode != 0:
+            raise CommandFailed(f"{' '.join(args[:2])} exited with status {completed.returncode}")
+        return completed.stdout.strip()
+
+    def close(self):
+        self.log_handle.close()
+
+# Function to create the mirror of a repository on the first run and fetch into it on later ones.
+# A lock file keeps two runs from fetching into the same mirror at once
+def update_mirror(job, mirror_dir):
+    mirror = os.path.join(mirror_dir, f"{repo_name(job.repo_url)}.git")
+    os.makedirs(mirror_dir, exist_ok=True)
+    with open(mirror + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        size_before = directory_size(mirror)
+        if os.path.isdir(mirror):
+            job.run(["git", "remote", "set-url", "origin", job.url], cwd=mirror)
+            job.run(["git", "fetch", "--prune", "--quiet", "origin"], cwd=mirror)
+        else:
+            job.run(["git", "clone", "--mirror", "--quiet", job.url, mirror], cwd=mirror_dir)
+        job.fetched_bytes += max(0, directory_size(mirror) - size_before)
+    return mirror
+
+# Function to check out a repository: a shallow, sparse work tree of the default branch made from
+# the mirror, or with no mirror directory a plain full clone
+def checkout_repo(job, mirror_dir=None, paths=None):
+    start = time.monotonic()
+    try:
+        if mirror_dir is None:
+            job.run(["git", "clone", "--quiet", job.url, job.work_dir], cwd=job.work_root)
+            job.fetched_bytes += directory_size(os.path.join(job.work_dir, ".git"))
+            return
+        mirror = update_mirror(job, mirror_dir)
+        job.run(["git", "clone", "--quiet", "--depth", "1", "--no-checkout", f"file://{mirror}", job.work_dir], cwd=job.work_root)
+        job.run(["git", "sparse-checkout", "set", "--no-cone"] + (paths or sparse_paths()))
+        job.run(["git", "checkout", "--quiet"])
+    finally:
+        job.clone_seconds += time.monotonic() - start
+
+# Function to identify the version of a file on disk, None if it does not exist. The renderer
+# replaces the files it writes, so a render changes the inode as well as the modification time
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+# Function to regenerate, commit and push README.md of a checked out repository. The renderer of
+# the zipapp replaces the repository's update script, which would set up a virtualenv every time
+def readme_stage(job, options):
+    if not os.path.isfile(os.path.join(job.work_dir, UPDATE_SCRIPT_PATH)):
+        job.log(f"Update script not found: {UPDATE_SCRIPT_PATH}")
+        return SKIPPED, "no update script"
+
+    # update_readme.sh passes on the renderer's unchanged and failed statuses only if it ends with
+    # them (see readme_manager.md). With an older script both look like success: the diff below still
+    # finds an unchanged README.md, but a failed render is reported as unchanged. So a status 0 from
+    # the script only counts as a render if README.md or the lock manifest was written again;
+    # otherwise the stage is not recorded and runs again next time
+    rendered_files = [os.path.join(job.work_dir, path) for path in ("README.md", LOCK_MANIFEST_PATH)]
+    if options.zipapp:
+        status = job.run([sys.executable, options.zipapp, "render", job.work_dir], check=False)
+    else:
+        signatures = [file_signature(path) for path in rendered_files]
+        status = job.run(["bash", UPDATE_SCRIPT_PATH], check=False)
+        if status == 0 and [file_signature(path) for path in rendered_files] == signatures:
+            job.log("The update script exited with status 0 without writing README.md or the lock manifest")
+            job.unverified_stages.add("readme")
+    if status == UNCHANGED_EXIT_CODE:
+        return UNCHANGED, "lock manifest up to date"
+    if status != 0:
+        return FAILED, f"{'renderer' if options.zipapp else 'update script'} exited with status {status}"
+    if not os.path.isfile(os.path.join(job.work_dir, "README.md")):
+        return FAILED, "README.md not found after the update script"
+
+    # Stage the README.md file and the lock manifest describing how it was rendered
+    paths = ["README.md"] + ([LOCK_MANIFEST_PATH] if os.path.isfile(os.path.join(job.work_dir, LOCK_MANIFEST_PATH)) else [])
+    job.run(["git", "add"] + paths)
+    job.run(["git", "--no-pager", "diff", "--cached", "--stat"] + paths)
+    if job.run(["git", "diff", "--cached", "--quiet"], check=False) == 0:
+        if "readme" in job.unverified_stages:
+            return UNCHANGED, "README.md not changed, no render seen"
+        return UNCHANGED, "README.md not changed"
+    job.run(["git", "commit", "-m", "Automatic Update README.md"])
+    job.run(["git", "push", job.url, "HEAD"])
+    return CHANGED, "pushed README.md"
+
+# Function to convert README.md, as the README stage left it in the checkout, to HTML in process.
+# readme.html (and with --search-index its shard) is collected for the batched portfolio update
+def html_stage(job, options):
+    if not os.path.isfile(os.path.join(job.work_dir, HTML_SCRIPT_PATH)):
+        job.log(f"Readme to Html script not found: {HTML_SCRIPT_PATH}")
+        return SKIPPED, "no readme to html script"
+
+    converter = load_converter_module("convert_readme_to_html", options.converter_path)
+    with open(os.path.join(job.work_dir, "README.md"), "r") as file:
+        readme_text = file.read()
+    branch = converter.read_head_branch(os.path.join(job.work_dir, ".git"))
+    context = converter.RepositoryContext(strip_git_suffix(job.repo_url), branch, job.work_dir)
+
+    artifact_dir = os.path.join(options.artifacts_dir, job.name)
+    os.makedirs(artifact_dir, exist_ok=True)
+    if options.search_index:
+        html_content, search_index = converter.markdown_to_indexed_html(readme_text, context, job.work_dir, section_cache=options.section_cache)
+        converter.write_search_index(search_index, os.path.join(artifact_dir, converter.SEARCH_INDEX_FILE))
+    else:
+        html_content = converter.markdown_to_html(readme_text, context, job.work_dir, section_cache=options.section_cache)
+    with open(os.path.join(artifact_dir, "readme.html"), "w") as file:
+        file.write(html_content)
+    job.log(f"Converted README.md to {os.path.join(artifact_dir, 'readme.html')}")
+    return PENDING, "waiting for the portfolio update"
+
+# Function to copy readme_manager/partials/introduction_main.md to the Home.md of the repository's wiki
+def wiki_stage(job, options):
+    if not os.path.isfile(os.path.join(job.work_dir, WIKI_INTRODUCTION_PATH)):
+        job.log(f"{WIKI_INTRODUCTION_PATH} not found, wiki not updated")
+        return SKIPPED, "no introduction partial"
+    if not os.path.isfile(os.path.join(job.work_dir, WIKI_HOME_SOURCE_PATH)):
+        return FAILED, f"{WIKI_HOME_SOURCE_PATH} not found"
+
+    wiki_url = f"{strip_git_suffix(job.url)}.wiki.git"
+    if job.run(["git", "ls-remote", "--heads", wiki_url], check=False) != 0:
+        job.log(f"Wiki repository does not exist for {job.name}. Please initialize the wiki using the GitHub UI.")
+        return SKIPPED, "wiki not initialized"
+
+    wiki_dir = job.work_dir + ".wiki"
+    job.run(["git", "clone", "--quiet", "--depth", "1", wiki_url, wiki_dir], cwd=job.work_root)
+    shutil.copyfile(os.path.join(job.work_dir, WIKI_HOME_SOURCE_PATH), os.path.join(wiki_dir, "Home.md"))
+    job.run(["git", "add", "Home.md"], cwd=wiki_dir)
+    job.run(["git", "--no-pager", "diff", "--cached", "--stat", "Home.md"], cwd=wiki_dir)
+    if job.run(["git", "diff", "--cached", "--quiet", "Home.md"], cwd=wiki_dir, check=False) == 0:
+        return UNCHANGED, "Home.md not changed"
+    job.run(["git", "commit", "-m", f"Automatic Update Home.md for {job.name}.wiki"], cwd=wiki_dir)
+    job.run(["git", "push", wiki_url, "HEAD"], cwd=wiki_dir)
+    return CHANGED, "pushed Home.md"
+
+STAGE_FUNCTIONS = {"readme": readme_stage, "html": html_stage, "wiki": wiki_stage}
+
+# Function to run the selected stages over a checkout. HTML is not converted from a README whose
+# update failed, and a timeout skips the stages after the one it interrupted. Any other error
+# fails the stage it came from, with its traceback in the repository log
+def run_stages(job, options):
+    stages = {}
+    for stage in options.stages:
+        if stage in stages:
+            continue
+        if stage == "html" and stages.get("readme", (None,))[0] == FAILED:
+            stages[stage] = (SKIPPED, "README update failed")
+            continue
+        try:
+            if stage_is_current(options, job.repo_url, stage, job.read(["git", "rev-parse", "HEAD"])):
+                job.log(f"== {stage} stage: inputs unchanged since the last run")
+                stages[stage] = (UNCHANGED, "inputs unchanged")
+                continue
+            job.log(f"== {stage} stage")
+            stages[stage] = STAGE_FUNCTIONS[stage](job, options)
+        except CommandTimeout as error:
+            stages[stage] = (FAILED, str(error))
+            for remaining in options.stages:
+                stages.setdefault(remaining, (SKIPPED, "repository timed out"))
+        except (CommandFailed, OSError) as error:
+            stages[stage] = (FAILED, str(error))
+        except Exception as error:
+            # The converter runs in process, so a README it cannot handle must fail only this
+            # repository's stage, not the whole run
+            job.log(traceback.format_exc())
+            stages[stage] = (FAILED, f"{type(error).__name__}: {error}")
+    return stages
+
+# Function to check out one repository once and run the stages over it, always returning a result.
+# A repository whose remote HEAD and other inputs match the last successful run is not cloned
+def process_repo(repo_url, options, work_root, env):
+    start = time.monotonic()
+    job = RepoJob(repo_url, options.environment, work_root, options.log_dir, options.timeout, env)
+    repo_sha = remote_head(job.url, env) if options.previous_state else None
+    if repo_sha is not None and all(stage_is_current(options, repo_url, stage, repo_sha) for stage in options.stages):
+        job.log(f"HEAD {repo_sha} and the other inputs are unchanged since the last run, nothing to do")
+        job.close()
+        stages = {stage: (UNCHANGED, "inputs unchanged") for stage in options.stages}
+        return RepoResult(repo_url, job.name, stages, time.monotonic() - start, job.log_file, repo_sha=repo_sha)
+    stages = {}
+    try:
+        checkout_repo(job, None if options.no_mirror else options.mirror_dir)
+        stages = run_stages(job, options)
+        # The state is recorded against HEAD after the run, which includes the README commit pushed
+        repo_sha = job.read(["git", "rev-parse", "HEAD"])
+    except (CommandTimeout, CommandFailed, OSError) as error:
+        repo_sha = None
+        if not stages:
+            stages = {stage: (SKIPPED, "checkout failed") for stage in options.stages}
+            stages[options.stages[0]] = (FAILED, f"checkout: {error}")
+    finally:
+        job.log(f"Finished in {time.monotonic() - start:.1f}s")
+        job.close()
+        if not options.keep_workdirs:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+            shutil.rmtree(job.work_dir + ".wiki", ignore_errors=True)
+    return RepoResult(repo_url, job.name, stages, time.monotonic() - start, job.log_file, job.clone_seconds, job.fetched_bytes, repo_sha, job.unverified_stages)
+
+# Function to load a precompression manifest, empty if absent
+def load_manifest(manifest_file):
+    try:
+        with open(manifest_file, "r") as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+# Function to update the portfolio with every collected readme.html in one commit and one push.
+# Artifacts are precompressed and only copied when their hash changed; search index shards are
+# merged into the site's index. Returns the repositories whose HTML changed on the portfolio
+def update_portfolio(job, options, commit_message):
+    precompress_html = load_converter_module("precompress_html", options.converter_path)
+    merge_search_index = load_converter_module("merge_search_index", options.converter_path)
+    checkout_repo(job, None if options.no_mirror else options.mirror_dir, [f"/{PORTFOLIO_PARTIALS_DIR}/"])
+
+    changed = set()
+    shards = {}
+    for name in sorted(os.listdir(options.artifacts_dir)):
+        artifact_dir = os.path.join(options.artifacts_dir, name)
+        if not os.path.isfile(os.path.join(artifact_dir, "readme.html")):
+            continue
+        manifest = precompress_html.precompress(os.path.join(artifact_dir, "readme.html"))
+        manifest_name = "readme.html" + precompress_html.MANIFEST_SUFFIX
+        target_dir = os.path.join(job.work_dir, PORTFOLIO_PARTIALS_DIR, name)
+        os.makedirs(target_dir, exist_ok=True)
+        target_manifest = load_manifest(os.path.join(target_dir, manifest_name))
+
+        for artifact in HTML_ARTIFACTS:
+            target = os.path.join(target_dir, artifact)
+            if artifact not in manifest:
+                # Not produced this time (e.g. brotli missing), so an old copy would be stale
+                if os.path.exists(target):
+                    os.remove(target)
+                    changed.add(name)
+            elif os.path.exists(target) and target_manifest.get(artifact, {}).get("sha256") == manifest[artifact]["sha256"]:
+                job.log(f"Unchanged: {PORTFOLIO_PARTIALS_DIR}/{name}/{artifact}")
+            else:
+                job.log(f"Copying {artifact} to {PORTFOLIO_PARTIALS_DIR}/{name}/{artifact}")
+                shutil.copyfile(os.path.join(artifact_dir, artifact), target)
+                changed.add(name)
+        shutil.copyfile(os.path.join(artifact_dir, manifest_name), os.path.join(target_dir, manifest_name))
+
+        shard = merge_search_index.load_index(os.path.join(artifact_dir, "search_index.json"))
+        if shard is not None:
+            shards[shard["repository"]] = shard
+
+    # Merge the collected search index shards into the site's single search index,
+    # keeping the repositories that were not processed in this run
+    paths = [f"{PORTFOLIO_PARTIALS_DIR}/*/readme.html*"]
+    if shards:
+        index_file = os.path.join(job.work_dir, PORTFOLIO_PARTIALS_DIR, "search_index.json")
+        existing = merge_search_index.load_index(index_file)
+        merged = merge_search_index.split_merged_index(existing) if existing else {}
+        merged.update(shards)
+        merge_search_index.write_index(merge_search_index.merge_shards(merged), index_file)
+        paths.append(f"{PORTFOLIO_PARTIALS_DIR}/search_index.json")
+
+    job.run(["git", "add", "-A"] + paths)
+    job.run(["git", "--no-pager", "diff", "--cached", "--stat"])
+    if job.run(["git", "diff", "--cached", "--quiet"], check=False) == 0:
+        return set()
+    job.run(["git", "commit", "-m", commit_message])
+    job.run(["git", "push", job.url, "HEAD"])
+    return changed
+
+# Function to run the batched portfolio update and record its outcome in each converted repository's html stage
+def publish_html(results, options, work_root, env):
+    converted = [result for result in results if result.stages.get("html", (None,))[0] == PENDING]
+    if not converted:
+        return
+    if options.repo:
+        commit_message = f"Automatic Update readme.html for {repo_name(options.repo)}"
+    else:
+        commit_message = "Automatic Update readme.html for all repositories"
+
+    portfolio_name = f"{repo_name(options.portfolio_url)}-portfolio"
+    job = RepoJob(options.portfolio_url, options.environment, work_root, options.log_dir, options.timeout, env, portfolio_name)
+    changed = set()
+    try:
+        changed = update_portfolio(job, options, commit_message)
+        # The push moves the portfolio's HEAD, so when the portfolio repository was processed in this
+        # run its state is recorded against the new HEAD, or the next run would not skip it
+        portfolio_sha = job.read(["git", "rev-parse", "HEAD"])
+        for result in results:
+            if strip_git_suffix(result.repo_url) == strip_git_suffix(options.portfolio_url) and result.repo_sha is not None:
+                result.repo_sha = portfolio_sha
+        for result in converted:
+            result.stages["html"] = (CHANGED, "pushed readme.html") if result.name in changed else (UNCHANGED, "readme.html not changed")
+    except (CommandTimeout, CommandFailed, OSError) as error:
+        for result in converted:
+            result.stages["html"] = (FAILED, f"portfolio update: {error}")
+    finally:
+        job.close()
+        if not options.keep_workdirs:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+    print(f"Portfolio {job.name}: {len(changed)} readme.html changed in {job.clone_seconds:.1f}s of cloning, log: {job.log_file}")
+
+def print_summary(results, stages):
+    width = max([len("Repository")] + [len(result.name) for result in results])
+    print()
+    print(f"{'Repository':<{width}}  " + "".join(f"{stage:<10}" for stage in stages) + f"{'Time':>7}  {'Clone':>7}  {'Fetched':>10}  Detail")
+    for result in results:
+        statuses = "".join(f"{result.stages.get(stage, (SKIPPED, ''))[0]:<10}" for stage in stages)
+        print(f"{result.name:<{width}}  {statuses}{result.seconds:>6.1f}s  {result.clone_seconds:>6.1f}s  {format_bytes(result.fetched_bytes):>10}  {result.detail}")
+    counts = {status: sum(result.status == status for result in results) for status in (CHANGED, UNCHANGED, SKIPPED, FAILED)}
+    print(", ".join(f"{count} {status}" for status, count in counts.items()))
+    clone_seconds = sum(result.clone_seconds for result in results)
+    fetched_bytes = sum(result.fetched_bytes for result in results)
+    print(f"Clone phase: {clone_seconds:.1f}s across workers, {format_bytes(fetched_bytes)} fetched")
+
+# Function to parse the comma separated stages of --stages, keeping the pipeline order
+def parse_stages(value):
+    stages = [stage.strip() for stage in value.split(",") if stage.strip()]
+    if not stages or any(stage not in STAGES for stage in stages):
+        raise argparse.ArgumentTypeError(f"expected a comma separated subset of {','.join(STAGES)}")
+    return [stage for stage in STAGES if stage in stages]
+
+# Function to parse the command line options
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Update the README.md, portfolio HTML and wiki Home.md of every repository in repos_list.sh, cloning each repository once")
+    parser.add_argument("environment", nargs="?", default="prod", help="prod uses GIT_USERNAME/GIT_PASSWORD for GitHub, local clones anonymously")
+    parser.add_argument("repo", nargs="?", help="Process only this repository URL")
+    parser.add_argument("--stages", type=parse_stages, default=list(STAGES), help=f"Comma separated stages to run (default: {','.join(STAGES)})")
+    parser.add_argument("--search-index", action="store_true", help="Also merge a search index of the README sections into the portfolio")
+    parser.add_argument("--portfolio-url", default=PORTFOLIO_URL, help="Repository receiving the readme.html files (default: %(default)s)")
+    parser.add_argument("--force", action="store_true", help="Run every repository even if its inputs are unchanged since the last successful run")
+    parser.add_argument("--state-file", default=STATE_FILE, help="SQLite file recording the inputs of the last successful run (default: %(default)s)")
+    parser.add_argument("--no-state", action="store_true", help="Neither skip unchanged repositories nor record this run")
+    parser.add_argument("--common-readme-url", default=COMMON_README_URL, help="Repository whose main branch head is recorded as the common_readme input (default: %(default)s)")
+    parser.add_argument("--zipapp", help="Prebuilt zipapp of build_zipapp.py to render and convert with")
+    parser.add_argument("--zipapp-dir", default=build_zipapp.ARTIFACT_DIR, help="Directory keeping the zipapps built for this checkout (default: %(default)s)")
+    parser.add_argument("--no-zipapp", action="store_true", help="Run each repository's update_readme.sh and import the converter from this checkout instead")
+    parser.add_argument("--repos-file", default=REPOS_LIST_FILE, help="Bash file defining the REPOS array")
+    parser.add_argument("--workers", type=int, default=FLEET_WORKERS, help="Repositories processed at the same time")
+    parser.add_argument("--timeout", type=int, default=REPO_TIMEOUT, help="Seconds one repository may take before it is stopped")
+    parser.add_argument("--work-dir", help="Directory for the per-repository checkouts (default: a temporary directory)")
+    parser.add_argument("--log-dir", default=LOG_DIR, help="Directory for the per-repository logs")
+    parser.add_argument("--mirror-dir", default=MIRROR_DIR, help="Directory keeping a bare mirror of each repository between runs")
+    parser.add_argument("--section-cache-dir", default=SECTION_CACHE_DIR, help="Directory keeping the HTML of converted README sections between runs (default: %(default)s)")
+    parser.add_argument("--no-mirror", action="store_true", help="Make full clones instead of sparse checkouts from the mirrors")
+    parser.add_argument("--keep-workdirs", action="store_true", help="Keep the checkouts after processing, for debugging")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    repos = [repo for repo in read_repos(args.repos_file) if args.repo is None or repo == args.repo]
+    if not repos:
+        print("No repositories to process")
+        return 1
+
+    # Build the renderer and converter zipapp once for the whole run, unless this version exists already
+    if args.no_zipapp:
+        args.zipapp = None
+    elif not args.zipapp and ("readme" in args.stages or "html" in args.stages):
+        try:
+            args.zipapp = build_zipapp.build_artifact(args.zipapp_dir)
+        except (subprocess.CalledProcessError, OSError) as error:
+            print(f"Could not build the zipapp, using the per-repository scripts: {error}")
+    args.converter_path = os.path.abspath(args.zipapp) if args.zipapp else HTML_CONVERTER_DIR
+    args.section_cache = None
+    if "html" in args.stages:
+        # Without the zipapp the converter needs the markdown package in this Python. When it is
+        # missing only the html stage is dropped; the README and wiki stages do not use it
+        try:
+            converter = load_converter_module("convert_readme_to_html", args.converter_path)
+        except ImportError as error:
+            print(f"✗ Skipping the html stage, it needs the packages in {os.path.join(HTML_CONVERTER_DIR, 'requirements.txt')}: {error}")
+            args.stages = [stage for stage in args.stages if stage != "html"]
+            if not args.stages:
+                return 1
+        else:
+            # One section cache for the whole run: sections shared by many READMEs are converted once
+            args.section_cache = converter.SectionCache(args.section_cache_dir)
+
+    os.makedirs(args.log_dir, exist_ok=True)
+    work_root = args.work_dir or tempfile.mkdtemp(prefix="fleet-")
+    args.artifacts_dir = os.path.join(work_root, "html_artifacts")
+    os.makedirs(args.artifacts_dir, exist_ok=True)
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+    if args.environment != "local":
+        env["GIT_ASKPASS"] = create_askpass_helper(work_root)
+
+    # Look up the heads every repository shares once, before any repository is cloned
+    state = None if args.no_state else StateStore(args.state_file)
+    args.previous_state = state.load() if state is not None and not args.force else {}
+    args.remote_inputs = {"common_readme_sha": None, "include_shas": {}}
+    if state is not None:
+        args.remote_inputs["common_readme_sha"] = remote_head(authenticated_url(args.common_readme_url, args.environment), env, COMMON_README_BRANCH)
+        args.remote_inputs["include_shas"] = {
+            f"{url}@{branch}": remote_head(authenticated_url(url, args.environment), env, branch) for url, branch in include_sources()
+        }
+
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(process_repo, repo, args, work_root, env) for repo in repos]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                print(f"{'✗' if result.status == FAILED else '✓'} {result.name}: {result.status} ({result.seconds:.1f}s), log: {result.log_file}")
+        if "html" in args.stages:
+            publish_html(results, args, work_root, env)
+            args.section_cache.evict()
+            args.section_cache.report()
+    finally:
+        if not args.work_dir and not args.keep_workdirs:
+            shutil.rmtree(work_root, ignore_errors=True)
+
+    # Remember the inputs of repositories where every stage succeeded; any failure runs the repository again next time
+    if state is not None:
+        for result in results:
+            if result.status == FAILED or result.repo_sha is None:
+                state.forget(result.repo_url)
+                continue
+            for stage in result.stages:
+                if stage in result.unverified_stages:
+                    state.forget(result.repo_url, stage)
+                else:
+                    state.record(result.repo_url, stage, dict(args.remote_inputs, repo_sha=result.repo_sha))
+        state.close()
+
+    order = {repo_name(repo): index for index, repo in enumerate(repos)}
+    results.sort(key=lambda result: order[result.name])
+    print_summary(results, args.stages)
+    return 1 if any(result.status == FAILED for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,21 @@
 import markdown
 import html
+import argparse
+import bisect
 import configparser
+import functools
+import hashlib
+import json
 import os
-from markdown.extensions.fenced_code import FencedCodeExtension
+import struct
+import tempfile
+import threading
+from urllib.parse import unquote
+from markdown.extensions.fenced_code import FencedBlockPreprocessor, FencedCodeExtension
 from markdown.extensions.nl2br import Nl2BrExtension
 from markdown.extensions.extra import ExtraExtension
-from bs4 import BeautifulSoup
+from markdown.extensions import Extension
+from markdown.postprocessors import Postprocessor
 import re
 
 def find_git_directory(start_path):
@@ -17,133 +27,792 @@ def find_git_directory(start_path):
         current_path = os.path.dirname(current_path)
     return None
 
-def get_github_raw_base_url():
-    start_path = os.path.abspath(os.path.dirname(__file__))  # Get the directory of the current script
-    git_dir = find_git_directory(start_path)
+# Where the converted README lives on GitHub, resolved once per repository
+class RepositoryContext:
+    def __init__(self, web_url, branch, root_dir=None):
+        self.web_url = web_url
+        self.branch = branch
+        self.root_dir = root_dir
+        self.raw_base_url = f"{web_url.replace('https://github.com', 'https://raw.githubusercontent.com')}/{branch}"
+        self.blob_base_url = f"{web_url}/blob/{branch}"
 
-    if git_dir is None:
-        raise ValueError("No .git directory found in parent directories")
+# Function to read the branch checked out in a git directory, or the commit for a detached HEAD
+def read_head_branch(git_dir):
+    with open(os.path.join(git_dir, 'HEAD'), 'r') as head_file:
+        head = head_file.read().strip()
+    if head.startswith('ref: refs/heads/'):
+        return head[len('ref: refs/heads/'):]
+    return head
 
+# Function to load the repository context of a git directory, cached for batch conversions
+@functools.lru_cache(maxsize=None)
+def load_repository_context(git_dir, branch=None):
     config_path = os.path.join(git_dir, 'config')
     config = configparser.ConfigParser()
     config.read(config_path)
 
-    if 'remote "origin"' in config:
-        url = config['remote "origin"']['url']
-        if url.startswith("git@"):
-            # Convert git@github.com:user/repo.git to https://github.com/user/repo
-            url = url.replace("git@", "https://").replace(".com:", ".com/")
-        elif url.startswith("https://"):
-            # Remove .git suffix if present
-            url = url[:-4] if url.endswith(".git") else url
-        
-        # Create the raw GitHub content URL
-        raw_base_url = url.replace("https://github.com", "https://raw.githubusercontent.com")
-        return raw_base_url + "/main"
-    else:
+    if 'remote "origin"' not in config:
         raise ValueError("No remote origin found in .git/config")
-        
-# Function to adjust code blocks in the markdown file
-def adjust_code_blocks(input_file, output_file):
-    with open(input_file, 'r') as file:
-        content = file.readlines()
-    
-    adjusted_content = []
-    inside_code_block = False
-    
-    for line in content:
-        if line.lstrip().startswith("```"):
-            inside_code_block = not inside_code_block
-            adjusted_content.append(line.lstrip())
-        elif inside_code_block:
-            adjusted_content.append(line)
-        else:
-            adjusted_content.append(line)
-    
-    with open(output_file, 'w') as file:
-        file.writelines(adjusted_content)
 
-# Function to convert local Markdown image links to raw GitHub content URLs
-def convert_local_image_urls(text):
+    url = config['remote "origin"']['url']
+    if url.startswith("git@"):
+        # Convert git@github.com:user/repo.git to https://github.com/user/repo
+        url = url.replace("git@", "https://").replace(".com:", ".com/")
+    # Remove .git suffix if present
+    url = url[:-4] if url.endswith(".git") else url
+
+    return RepositoryContext(url, branch or read_head_branch(git_dir), os.path.dirname(git_dir))
+
+# Function to find the repository containing start_path (default: this script) and return its context
+def resolve_repository_context(start_path=None, branch=None):
+    if start_path is None:
+        start_path = os.path.dirname(__file__)  # Get the directory of the current script
+    git_dir = find_git_directory(os.path.abspath(start_path))
+
+    if git_dir is None:
+        raise ValueError("No .git directory found in parent directories")
+
+    return load_repository_context(git_dir, branch)
+
+def get_github_raw_base_url():
+    return resolve_repository_context().raw_base_url
+
+# One pattern for everything rewritten before markdown conversion: indentation in front of
+# code fences and markdown image links
+MARKDOWN_REWRITE_PATTERN = re.compile(r'(?P<fence>^[^\S\n]+(?=```))|!\[(?P<alt>.*?)\]\((?P<url>.*?)\)', re.MULTILINE)
+
+# Function to read the intrinsic (width, height) of a PNG, GIF, JPEG or WebP image, or None.
+# A truncated or malformed header also gives None
+def read_image_size(data):
+    try:
+        if data.startswith(b'\x89PNG\r\n\x1a\n') and data[12:16] == b'IHDR':
+            return struct.unpack('>II', data[16:24])
+        if data[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', data[6:10])
+        if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+            chunk = data[12:16]
+            if chunk == b'VP8 ':
+                width, height = struct.unpack('<HH', data[26:30])
+                return width & 0x3fff, height & 0x3fff
+            if chunk == b'VP8L':
+                bits = struct.unpack('<I', data[21:25])[0]
+                return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+            if chunk == b'VP8X' and len(data) >= 30:
+                return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+            return None
+        if data[:2] == b'\xff\xd8':
+            position = 2
+            while position + 9 < len(data):
+                if data[position] != 0xff:
+                    position += 1
+                    continue
+                marker = data[position + 1]
+                if marker in (0xd8, 0x01) or 0xd0 <= marker <= 0xd7 or marker == 0xff:
+                    position += 1 if marker == 0xff else 2
+                    continue
+                length = struct.unpack('>H', data[position + 2:position + 4])[0]
+                # Start of frame markers carry the dimensions, except DHT, JPG and DAC
+                if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+                    height, width = struct.unpack('>HH', data[position + 5:position + 9])
+                    return width, height
+                position += 2 + length
+        return None
+    except struct.error:
+        return None
+
+IMAGE_MANIFEST_FILE = 'image_manifest.json'
+
+# Cached description (dimensions and content hash) of every local image a README references,
+# refreshed only when a file's size or modification time changes
+class ImageManifest:
+    def __init__(self, manifest_file=IMAGE_MANIFEST_FILE, hash_urls=False):
+        self.manifest_file = manifest_file
+        self.hash_urls = hash_urls
+        try:
+            with open(manifest_file, 'r') as manifest:
+                self.entries = json.load(manifest)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    # Function to map an image URL to a file in the repository, if it points into it
+    def local_path(self, url, context):
+        if context is None or context.root_dir is None or not url.startswith(context.raw_base_url + '/'):
+            return None
+        path = os.path.join(context.root_dir, *unquote(url[len(context.raw_base_url) + 1:]).split('/'))
+        return path if os.path.isfile(path) else None
+
+    # Function to return the manifest entry for an image file, reading the file only if it changed
+    def describe(self, path):
+        stat = os.stat(path)
+        entry = self.entries.get(path)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            with open(path, 'rb') as image_file:
+                data = image_file.read()
+            size = read_image_size(data)
+            entry = {
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'sha256': hashlib.sha256(data).hexdigest(),
+                'width': size[0] if size else None,
+                'height': size[1] if size else None,
+            }
+            self.entries[path] = entry
+        return entry
+
+    # Function to write the manifest back so the next conversion can reuse it
+    def save(self):
+        with open(self.manifest_file, 'w') as manifest:
+            json.dump(self.entries, manifest, indent=2, sort_keys=True)
+            manifest.write('\n')
+
+# Function to build the HTML <img> tag for an image URL. With lazy loading on, images
+# described by the manifest also get their dimensions and, optionally, a content-hashed URL
+def image_tag(alt_text, url, lazy=False, asset=None, hash_urls=False):
+    if asset is not None and hash_urls:
+        url = f'{url}{"&" if "?" in url else "?"}v={asset["sha256"][:12]}'
+    attributes = f'alt="{alt_text}" src="{url}"'
+    if asset is not None and asset['width'] and asset['height']:
+        attributes += f' width="{asset["width"]}" height="{asset["height"]}"'
+    if lazy:
+        attributes += ' loading="lazy" decoding="async"'
+    if "raw.githubusercontent.com" in url:
+        return f'<img class="d-block w-100" {attributes} />'
+    return f'<img {attributes} />'
+
+# Function to normalize code fences and turn image links into <img> tags in a single pass:
+# GitHub blob URLs and local paths are rewritten to raw GitHub content URLs first.
+# The repository context is only looked up, once, if a local image is found or images
+# are described by a manifest
+def rewrite_markdown(text, context=None, start_path=None, branch=None, image_manifest=None):
+    def repository():
+        nonlocal context
+        if context is None:
+            context = resolve_repository_context(start_path, branch)
+        return context
+
+    def describe(url):
+        try:
+            path = image_manifest.local_path(url, repository())
+        except ValueError:
+            return None
+        return image_manifest.describe(path) if path else None
+
     def replace(match):
-        alt_text = match.group(1)
-        url = match.group(2)
-        GITHUB_RAW_BASE_URL =  get_github_raw_base_url()
+        if match.group('fence') is not None:
+            return ''
+        alt_text = match.group('alt')
+        url = match.group('url')
 
-        # Check if the URL is a local reference (does not contain "http" or "https")
         if not url.startswith("http"):
-            raw_url = f"{GITHUB_RAW_BASE_URL}/{url.lstrip('/')}"
-            return f'![{alt_text}]({raw_url})'
-        return match.group(0)
+            url = f"{repository().raw_base_url}/{url.lstrip('/')}"
+        elif "github.com" in url and "/blob/" in url:
+            url = url.replace("github.com", "raw.githubusercontent.com").replace("/blob/", "/")
 
-    image_pattern = re.compile(r'!\[(.*?)\]\((.*?)\)')
-    return image_pattern.sub(replace, text)
+        if ']' in alt_text or ')' in url or not re.match(r'https?://', url):
+            return f'![{alt_text}]({url})'
+        if image_manifest is None:
+            return image_tag(alt_text, url)
+        return image_tag(alt_text, url, True, describe(url), image_manifest.hash_urls)
 
-# Function to convert GitHub image URLs to raw GitHub content URLs
-def convert_github_image_urls(text):
-    def replace(match):
-        alt_text = match.group(1)
-        url = match.group(2)
-        if "github.com" in url and "/blob/" in url:
-            raw_url = url.replace("github.com", "raw.githubusercontent.com").replace("/blob/", "/")
-            return f'![{alt_text}]({raw_url})'
-        return match.group(0)
-
-    image_pattern = re.compile(r'!\[([^\]]*)\]\((https?://[^\)]+)\)')
-    return image_pattern.sub(replace, text)
-
-# Function to convert Markdown image links to HTML <img> tags
-def convert_images_to_html(text):
-    def replace(match):
-        alt_text = match.group(1)
-        url = match.group(2)
+    return MARKDOWN_REWRITE_PATTERN.sub(replace, text)
 
-        if "raw.githubusercontent.com" in url:
-            return f'<img class="d-block w-100" alt="{alt_text}" src="{url}" />'
-        return f'<img alt="{alt_text}" src="{url}" />'
+# Escapes the text of <code> elements once the rest of the markdown pipeline has run,
+# so code displays correctly without re-parsing the whole document afterwards
+class CodeEscapePostprocessor(Postprocessor):
+    def run(self, text):
+        return escape_code(text)
 
-    image_pattern = re.compile(r'!\[([^\]]*)\]\((https?://[^\)]+)\)')
-    return image_pattern.sub(replace, text)
+CODE_PATTERN = re.compile(r'(<code[^>]*>)([^<]*)(</code>)')
 
+# Function to escape the text of every <code> element the same way, whichever engine produced it
+def escape_code(text):
+    return CODE_PATTERN.sub(lambda match: match.group(1) + html.escape(html.unescape(match.group(2))) + match.group(3), text)
 
-# Function to process the markdown content and convert it to HTML
-def process_markdown_to_html(input_file, intermediate_file, output_file):
-    # Adjust code blocks
-    adjust_code_blocks(input_file, intermediate_file)
-    
-    # Read the adjusted markdown file
-    with open(intermediate_file, 'r') as file:
-        readme_text = file.read()
-    
-    # Convert GitHub image URLs to raw GitHub content URLs
-    readme_text = convert_github_image_urls(readme_text)
-    
-    # Convert local image URLs to raw GitHub content URLs
-    readme_text = convert_local_image_urls(readme_text)
-
-    # Convert Markdown image links to HTML <img> tags
-    readme_text = convert_images_to_html(readme_text)
-    
-    # Convert markdown to HTML with preserved code blocks, <br> tags for line breaks, and URL handling
-    html_content = markdown.markdown(readme_text, extensions=[FencedCodeExtension(), Nl2BrExtension(), ExtraExtension()])
-    
-    # Parse the HTML content with BeautifulSoup to ensure no alteration to existing HTML tags and attributes
+class CodeEscapeExtension(Extension):
+    def extendMarkdown(self, md):
+        # Lowest priority runs last, after stashed code blocks are restored
+        md.postprocessors.register(CodeEscapePostprocessor(md), 'code_escape', 5)
+
+# Bump when the conversion pipeline changes so cached section HTML is not reused
+SECTION_CACHE_VERSION = "1"
+HTML_CACHE_DIR = os.environ.get("README_HTML_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "common_readme", "html_sections"))
+SECTION_CACHE_MAX_BYTES = 100 * 1024 * 1024
+
+# Sections start at top-level (# and ##) headings that open a new block, i.e. follow a
+# blank line, and are outside code fences
+SECTION_HEADING_PATTERN = re.compile(r'(?:\A|(?<=\n)[ \t]*\n)(?=#{1,2} )')
+# Reference links and footnotes can point across sections, such documents are converted whole
+CROSS_SECTION_PATTERN = re.compile(r'^ {0,3}\[\^?[^\]]+\]:', re.MULTILINE)
+
+# On-disk cache of converted HTML fragments keyed by the hash of their markdown,
+# shared across runs and across repositories, and by the threads of one fleet run
+class SectionCache:
+    def __init__(self, cache_dir=HTML_CACHE_DIR, max_bytes=SECTION_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, section, backend_version=None):
+        backend_version = backend_version or markdown.__version__
+        return hashlib.sha256(f"{SECTION_CACHE_VERSION}\0{backend_version}\0{section}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        path = os.path.join(self.cache_dir, key)
+        try:
+            with open(path, 'r', encoding='utf-8') as fragment_file:
+                fragment = fragment_file.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        os.utime(path)
+        with self.lock:
+            self.hits += 1
+        return fragment
+
+    def put(self, key, fragment):
+        with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=self.cache_dir, delete=False) as fragment_file:
+            fragment_file.write(fragment)
+        os.replace(fragment_file.name, os.path.join(self.cache_dir, key))
+
+    # Drop the least recently used fragments until the cache fits in max_bytes. Another run
+    # evicting at the same time may remove a fragment first
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def report(self):
+        print(f"Section cache: {self.hits} hits, {self.misses} misses")
+
+# Function to create the markdown converter: preserved code blocks, <br> tags for line breaks,
+# URL handling and escaped code
+def create_markdown():
+    return markdown.Markdown(extensions=[FencedCodeExtension(), Nl2BrExtension(), ExtraExtension(), CodeEscapeExtension()])
+
+# Markdown engine used by default: Python-Markdown with the extensions above
+class PythonMarkdownBackend:
+    name = 'python-markdown'
+
+    def __init__(self):
+        self.md = create_markdown()
+        self.version = markdown.__version__
+        self.block_level_elements = self.md.block_level_elements
+
+    def convert(self, text):
+        return self.md.reset().convert(text)
+
+# A table cell alignment as cmark-gfm writes it, and as Python-Markdown does
+TABLE_ALIGN_PATTERN = re.compile(r'<(th|td) align="(left|center|right)">')
+# A paragraph made of a single tag, which cmark-gfm keeps as a raw HTML block
+STANDALONE_TAG_PATTERN = re.compile(r'(?:\A|(?<=\n\n))(<([A-Za-z][\w-]*)\b[^<>]*>)[ \t]*(?=\n\n|\n?\Z)')
+
+# Function to wrap paragraphs made of a single inline tag, such as the <img> tags written by
+# rewrite_markdown, in <p> as Python-Markdown does. Tags in code fences or raw HTML blocks are left alone
+def wrap_standalone_inline_html(text, block_level_elements):
+    fences = [match.span() for match in FencedBlockPreprocessor.FENCED_BLOCK_RE.finditer(text)]
+    fence_starts = [start for start, _ in fences]
+    tag_pattern = re.compile(r'<(/?)(' + '|'.join(map(re.escape, block_level_elements)) + r')\b', re.IGNORECASE)
+
+    def in_fence(position):
+        index = bisect.bisect_right(fence_starts, position) - 1
+        return index >= 0 and position < fences[index][1]
+
+    block_tags = set(block_level_elements)
+    depth = 0
+    scanned = 0
+    position = 0
+    pieces = []
+    for match in STANDALONE_TAG_PATTERN.finditer(text):
+        for tag in tag_pattern.finditer(text, scanned, match.start()):
+            if not in_fence(tag.start()):
+                depth = max(0, depth - 1) if tag.group(1) else depth + 1
+        scanned = match.start()
+        if depth or match.group(2).lower() in block_tags or in_fence(match.start()):
+            pieces.append(text[position:match.end()])
+        else:
+            pieces.append(f'{text[position:match.start()]}<p>{match.group(1)}</p>')
+        position = match.end()
+    pieces.append(text[position:])
+    return ''.join(pieces)
+
+# A table delimiter row, and a code span
+TABLE_DELIMITER_PATTERN = re.compile(r'^ {0,3}\|?[ \t]*:?-+:?[ \t]*(?:\|[ \t]*:?-+:?[ \t]*)*\|?[ \t]*$')
+CODE_SPAN_PATTERN = re.compile(r'(?<!`)(`+)(?!`)(.+?)(?<!`)\1(?!`)')
+
+# Function to double the backslash of \| in code spans of table rows. cmark-gfm turns \| into a
+# plain pipe there, while Python-Markdown keeps code as written
+def escape_table_code_pipes(text):
+    if '\\|' not in text:
+        return text
+    fences = [match.span() for match in FencedBlockPreprocessor.FENCED_BLOCK_RE.finditer(text)]
+    fence_index = 0
+
+    def escape_row(row):
+        return CODE_SPAN_PATTERN.sub(lambda match: match.group(0).replace('\\|', '\\\\|'), row)
+
+    lines = text.split('\n')
+    offset = 0
+    in_table = False
+    for index, line in enumerate(lines):
+        while fence_index < len(fences) and fences[fence_index][1] <= offset:
+            fence_index += 1
+        if not line.strip() or (fence_index < len(fences) and fences[fence_index][0] <= offset):
+            in_table = False
+        elif in_table:
+            lines[index] = escape_row(line)
+        elif index > 0 and '|' in line and '|' in lines[index - 1] and TABLE_DELIMITER_PATTERN.match(line):
+            in_table = True
+            lines[index - 1] = escape_row(lines[index - 1])
+        offset += len(line) + 1
+    return '\n'.join(lines)
+
+# Lines cmark-gfm reads differently from Python-Markdown: list items, since CommonMark lets a list
+# start right after a paragraph line, nests with two spaces, keeps start numbers and decides
+# looseness per list, and code fences the fenced code extension does not accept, such as an
+# indented fence or one with words after its language
+LIST_ITEM_PATTERN = re.compile(r'^ {0,3}(?:\d{1,9}[.)]|[*+-])(?:[ \t]|$)', re.MULTILINE)
+FENCE_LINE_PATTERN = re.compile(r'^ {0,3}(?:`{3,}|~{3,})', re.MULTILINE)
+# A line starting with a tag and followed by more text: cmark-gfm starts a raw HTML block there
+# that runs to the next blank line, while Python-Markdown keeps an inline tag in its paragraph
+HTML_TAG_LINE_PATTERN = re.compile(r'^ {0,3}</?[A-Za-z][^\n]*\n(?=[ \t]*\S)', re.MULTILINE)
+# A setext underline: below a paragraph of several lines cmark-gfm makes the whole paragraph
+# the heading, Python-Markdown only accepts a single line heading
+SETEXT_UNDERLINE_PATTERN = re.compile(r'^ {0,3}(?:=+|-+)[ \t]*$', re.MULTILINE)
+BLANK_LINES_PATTERN = re.compile(r'\n(?:[ \t]*\n)+')
+
+# Function to find the start of every paragraph of several lines that ends in a setext underline
+def setext_paragraph_starts(text):
+    starts = []
+    for match in SETEXT_UNDERLINE_PATTERN.finditer(text):
+        heading_start = text.rfind('\n', 0, max(0, match.start() - 1)) + 1
+        if heading_start == 0 or not text[heading_start:match.start()].strip():
+            continue
+        previous_start = text.rfind('\n', 0, heading_start - 1) + 1
+        if text[previous_start:heading_start].strip():
+            starts.append(previous_start)
+    return starts
+
+# Function to split markdown at blank lines outside code fences into (python_markdown, chunk)
+# pairs, where a Python-Markdown chunk starts at a block with a line the two engines read
+# differently and runs over the blocks Python-Markdown keeps in the same list: further such
+# blocks and indented blocks. Blocks inside a block-level HTML element that spans blank lines
+# are Python-Markdown too, since it keeps the whole element raw where cmark-gfm parses the
+# markdown between its blank lines
+def split_python_markdown_blocks(text, block_level_elements=()):
+    fences = [match.span() for match in FencedBlockPreprocessor.FENCED_BLOCK_RE.finditer(text)]
+    fence_starts = [start for start, _ in fences]
+
+    def in_fence(position):
+        index = bisect.bisect_right(fence_starts, position) - 1
+        return index >= 0 and position < fences[index][1]
+
+    divergent = sorted(
+        [match.start() for pattern in (LIST_ITEM_PATTERN, FENCE_LINE_PATTERN, HTML_TAG_LINE_PATTERN)
+         for match in pattern.finditer(text) if not in_fence(match.start())]
+        + [start for start in setext_paragraph_starts(text) if not in_fence(start)]
+    )
+    html_tags = []
+    if block_level_elements:
+        tag_pattern = re.compile(r'<(/?)(' + '|'.join(map(re.escape, block_level_elements)) + r')\b|<(!)--|-(-)>', re.IGNORECASE)
+        html_tags = [match for match in tag_pattern.finditer(text) if not in_fence(match.start())]
+    separators = [match.end() for match in BLANK_LINES_PATTERN.finditer(text) if not in_fence(match.start())]
+    chunks = []
+    start = 0
+    line_index = 0
+    tag_index = 0
+    depth = {}
+    for end in separators + [len(text)]:
+        if end <= start:
+            continue
+        while line_index < len(divergent) and divergent[line_index] < start:
+            line_index += 1
+        python_markdown = line_index < len(divergent) and divergent[line_index] < end
+        open_before = any(depth.values())
+        while tag_index < len(html_tags) and html_tags[tag_index].start() < end:
+            closing, tag, comment_open, comment_close = html_tags[tag_index].groups()
+            if comment_open or comment_close:
+                closing, tag = comment_close, '!--'
+            tag = tag.lower()
+            # A stray closing tag closes nothing
+            depth[tag] = max(0, depth.get(tag, 0) - 1) if closing else depth.get(tag, 0) + 1
+            tag_index += 1
+        if open_before or any(depth.values()):
+            python_markdown = True
+        if chunks and chunks[-1][0] and text.startswith(('    ', '\t'), start):
+            python_markdown = True
+        if chunks and chunks[-1][0] == python_markdown:
+            chunks[-1][1] += text[start:end]
+        else:
+            chunks.append([python_markdown, text[start:end]])
+        start = end
+    return [(python_markdown, chunk) for python_markdown, chunk in chunks]
+
+# cmark-gfm, GitHub's C implementation of CommonMark with tables: many times faster than
+# Python-Markdown. The blocks where the two engines disagree, mostly lists, are converted with
+# Python-Markdown and everything else with cmark-gfm
+class GfmBackend:
+    name = 'gfm'
+
+    def __init__(self):
+        try:
+            import cmarkgfm
+            from cmarkgfm.cmark import CMARK_VERSION, Options
+        except ImportError:
+            raise ImportError("The gfm backend needs the cmarkgfm package: pip install cmarkgfm")
+        self.cmarkgfm = cmarkgfm
+        # Raw HTML is kept and every newline is a line break, like the nl2br extension
+        self.options = Options.CMARK_OPT_UNSAFE | Options.CMARK_OPT_HARDBREAKS
+        self.python_markdown = PythonMarkdownBackend()
+        self.version = f'cmark-gfm {CMARK_VERSION}, markdown {self.python_markdown.version}'
+        self.block_level_elements = self.python_markdown.block_level_elements
+
+    def convert_commonmark(self, text):
+        text = wrap_standalone_inline_html(escape_table_code_pipes(text), self.block_level_elements)
+        html_content = self.cmarkgfm.markdown_to_html_with_extensions(text, options=self.options, extensions=['table'])
+        html_content = TABLE_ALIGN_PATTERN.sub(r'<\1 style="text-align: \2;">', html_content)
+        return escape_code(html_content.rstrip('\n'))
+
+    def convert(self, text):
+        chunks = split_python_markdown_blocks(text, self.block_level_elements)
+        # Reference definitions apply to the whole document, so a document mixing them with
+        # Python-Markdown chunks cannot be converted piecewise
+        if any(python_markdown for python_markdown, _ in chunks) and CROSS_SECTION_PATTERN.search(text):
+            return self.python_markdown.convert(text)
+        fragments = (
+            self.python_markdown.convert(chunk) if python_markdown else self.convert_commonmark(chunk)
+            for python_markdown, chunk in chunks
+        )
+        return '\n'.join(fragment for fragment in fragments if fragment)
+
+MARKDOWN_BACKENDS = {
+    PythonMarkdownBackend.name: PythonMarkdownBackend,
+    GfmBackend.name: GfmBackend,
+}
+
+# Function to create the markdown engine registered under a name
+def create_backend(name=PythonMarkdownBackend.name):
+    return MARKDOWN_BACKENDS[name]()
+
+# Function to split markdown at top-level headings, never inside a code fence as the
+# fenced code extension itself would recognise it
+def split_sections(text):
+    fences = [match.span() for match in FencedBlockPreprocessor.FENCED_BLOCK_RE.finditer(text)]
+    sections = []
+    start = 0
+    fence_index = 0
+    for heading in SECTION_HEADING_PATTERN.finditer(text):
+        position = heading.end()
+        while fence_index < len(fences) and fences[fence_index][1] <= position:
+            fence_index += 1
+        if fence_index < len(fences) and fences[fence_index][0] <= position:
+            continue
+        if position > start:
+            sections.append(text[start:position])
+            start = position
+    sections.append(text[start:])
+    return sections
+
+# Function to merge sections until every raw HTML block opened in one is also closed in it,
+# since an unclosed block swallows the markdown that follows
+def merge_open_html_sections(sections, block_level_elements):
+    tag_pattern = re.compile(r'<(/?)(' + '|'.join(map(re.escape, block_level_elements)) + r')\b|<(!)--|-(-)>', re.IGNORECASE)
+    merged = []
+    pending = ''
+    for section in sections:
+        pending += section
+        depth = {}
+        for closing, tag, comment_open, comment_close in tag_pattern.findall(pending):
+            if comment_open or comment_close:
+                closing, tag = comment_close, '!--'
+            tag = tag.lower()
+            # A stray closing tag closes nothing
+            depth[tag] = max(0, depth.get(tag, 0) - 1) if closing else depth.get(tag, 0) + 1
+        if not any(depth.values()):
+            merged.append(pending)
+            pending = ''
+    if pending:
+        merged.append(pending)
+    return merged
+
+# Function to convert markdown section by section, yielding the HTML of each top-level section
+# and reusing cached HTML for unchanged sections when a cache is given
+def iter_section_html(readme_text, section_cache=None, backend=None):
+    backend = backend or PythonMarkdownBackend()
+    if CROSS_SECTION_PATTERN.search(readme_text):
+        yield backend.convert(readme_text)
+        return
+
+    for section in merge_open_html_sections(split_sections(readme_text), backend.block_level_elements):
+        key = section_cache.key(section, backend.version) if section_cache is not None else None
+        fragment = section_cache.get(key) if key is not None else None
+        if fragment is None:
+            fragment = backend.convert(section)
+            if key is not None:
+                section_cache.put(key, fragment)
+        if fragment:
+            yield fragment
+
+# Function to convert markdown section by section, reusing cached HTML for unchanged sections
+def convert_sections(readme_text, section_cache, backend=None):
+    return '\n'.join(iter_section_html(readme_text, section_cache, backend))
+
+SECTION_HEADING_HTML_PATTERN = re.compile(r'^<h([12])>(.*?)</h\1>', re.DOTALL)
+PAGES_INDEX_VERSION = 1
+PRECOMPRESSED_SUFFIXES = ('.gz', '.br', '.manifest.json')
+
+# Function to build a GitHub style anchor for a heading, unique within the document
+def heading_slug(title, used_slugs):
+    slug = re.sub(r'[^\w\- ]', '', html.unescape(title).strip().lower()).replace(' ', '-') or 'section'
+    candidate = slug
+    suffix = 0
+    while candidate in used_slugs:
+        suffix += 1
+        candidate = f'{slug}-{suffix}'
+    used_slugs.add(candidate)
+    return candidate
+
+# Function to split converted README HTML into one page per top-level section. Returns the HTML
+# before the first heading and a list of pages, each with a stable anchor on its heading
+def markdown_to_pages(readme_text, context=None, start_path=None, branch=None, section_cache=None, image_manifest=None, backend=None):
+    readme_text = rewrite_markdown(readme_text, context, start_path, branch, image_manifest)
+
+    preamble = []
+    pages = []
+    # index.html is the table of contents, so a section titled "Index" gets index-1.html
+    used_slugs = {'index'}
+    for fragment in iter_section_html(readme_text, section_cache, backend):
+        heading = SECTION_HEADING_HTML_PATTERN.match(fragment)
+        if heading is None:
+            # Content before the first heading belongs to the index page, later content to the page before it
+            if pages:
+                pages[-1]['html'] += '\n' + fragment
+            else:
+                preamble.append(fragment)
+            continue
+        title = re.sub(r'<[^>]+>', '', heading.group(2)).strip()
+        slug = heading_slug(title, used_slugs)
+        pages.append({
+            'slug': slug,
+            'title': title,
+            'level': int(heading.group(1)),
+            'html': f'<h{heading.group(1)} id="{slug}">' + fragment[len(f'<h{heading.group(1)}>'):],
+        })
+    return '\n'.join(preamble), pages
+
+# Function to render the index page: the preamble and a table of contents linking each section page
+def render_pages_index(preamble, pages):
+    items = '\n'.join(
+        f'<li class="toc-level-{page["level"]}"><a href="#{page["slug"]}" data-section-url="{page["slug"]}.html">{page["title"]}</a></li>'
+        for page in pages
+    )
+    toc = f'<nav class="readme-toc">\n<ul>\n{items}\n</ul>\n</nav>'
+    return f'{preamble}\n{toc}' if preamble else toc
+
+# Function to write the index page, one HTML fragment per section and a JSON index to a directory,
+# removing section pages left over from a previous run. Returns the paths written
+def write_pages(preamble, pages, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    index_file = os.path.join(output_dir, 'index.json')
+    try:
+        with open(index_file, 'r') as file:
+            previous = {entry['file'] for entry in json.load(file)['sections']}
+    except (FileNotFoundError, ValueError, KeyError):
+        previous = set()
+
+    written = []
+    entries = []
+    for page in pages:
+        file_name = f'{page["slug"]}.html'
+        content = page['html'].encode('utf-8')
+        with open(os.path.join(output_dir, file_name), 'wb') as file:
+            file.write(content)
+        written.append(os.path.join(output_dir, file_name))
+        entries.append({
+            'slug': page['slug'],
+            'title': html.unescape(page['title']),
+            'level': page['level'],
+            'file': file_name,
+            'bytes': len(content),
+            'sha256': hashlib.sha256(content).hexdigest(),
+        })
+
+    with open(os.path.join(output_dir, 'index.html'), 'w') as file:
+        file.write(render_pages_index(preamble, pages))
+    written.append(os.path.join(output_dir, 'index.html'))
+    with open(index_file, 'w') as file:
+        json.dump({'version': PAGES_INDEX_VERSION, 'index': 'index.html', 'sections': entries}, file, indent=2, ensure_ascii=False)
+        file.write('\n')
+
+    for stale in previous - {entry['file'] for entry in entries}:
+        stale_file = os.path.join(output_dir, os.path.basename(stale))
+        if os.path.exists(stale_file):
+            os.remove(stale_file)
+        remove_precompressed(stale_file)
+    return written
+
+# Function to remove the .gz/.br variants and manifest precompress_html.py wrote for an HTML file,
+# since nginx would keep serving them in place of a rewritten file
+def remove_precompressed(html_file):
+    for suffix in PRECOMPRESSED_SUFFIXES:
+        if os.path.exists(html_file + suffix):
+            os.remove(html_file + suffix)
+
+SEARCH_INDEX_FILE = 'search_index.json'
+SEARCH_INDEX_VERSION = 1
+# Search terms: words, keeping the dots, dashes and underscores of commands, settings and hosts
+SEARCH_TERM_PATTERN = re.compile(r'\w+(?:[.\-]\w+)*')
+SEARCH_STOP_WORDS = frozenset('a an and are as at be by for from if in is it of on or that the this to with'.split())
+
+# Function to name the repository a README belongs to, for its search index shard
+def repository_name(start_path, context=None):
+    try:
+        return (context or resolve_repository_context(start_path)).web_url.rstrip('/').rsplit('/', 1)[-1]
+    except ValueError:
+        return os.path.basename(os.path.abspath(start_path))
+
+# Function to build the search index shard of a README: its sections and, for every term, the
+# sections it occurs in with its word positions there, as [section, position, position, ...]
+def build_search_index(repository, preamble, pages, split=False):
+    sections = []
+    documents = []
+    if preamble:
+        sections.append({'anchor': '', 'title': repository, 'url': 'index.html' if split else '#'})
+        documents.append(preamble)
+    for page in pages:
+        url = f'{page["slug"]}.html' if split else f'#{page["slug"]}'
+        sections.append({'anchor': page['slug'], 'title': html.unescape(page['title']), 'url': url})
+        documents.append(page['html'])
+
+    terms = {}
+    for index, document in enumerate(documents):
+        text = html.unescape(re.sub(r'<[^>]+>', ' ', document)).lower()
+        for position, term in enumerate(SEARCH_TERM_PATTERN.findall(text)):
+            if len(term) < 2 or term in SEARCH_STOP_WORDS:
+                continue
+            postings = terms.setdefault(term, [])
+            if not postings or postings[-1][0] != index:
+                postings.append([index])
+            postings[-1].append(position)
+    return {'version': SEARCH_INDEX_VERSION, 'repository': repository, 'sections': sections, 'terms': terms}
+
+def write_search_index(index, index_file):
+    with open(index_file, 'w') as file:
+        json.dump(index, file, ensure_ascii=False, separators=(',', ':'))
+
+# Function to re-indent HTML with BeautifulSoup, as older versions of this script always did
+def prettify_html(html_content):
+    from bs4 import BeautifulSoup
     soup = BeautifulSoup(html_content, 'html.parser')
-    
+
     # Escape HTML entities in code blocks to ensure they are displayed correctly
     for code_block in soup.find_all('code'):
         if code_block.string:
             escaped_code = html.escape(code_block.string)
             code_block.string.replace_with(escaped_code)
-    
+
+    return soup.prettify(formatter=None)
+
+# Function to convert README markdown text to HTML entirely in memory
+def markdown_to_html(readme_text, context=None, start_path=None, branch=None, prettify=False, section_cache=None, image_manifest=None, backend=None):
+    readme_text = rewrite_markdown(readme_text, context, start_path, branch, image_manifest)
+
+    if section_cache is not None:
+        html_content = convert_sections(readme_text, section_cache, backend)
+    else:
+        html_content = (backend or PythonMarkdownBackend()).convert(readme_text)
+    return prettify_html(html_content) if prettify else html_content
+
+# Function to convert README markdown text to HTML plus its search index, entirely in memory.
+# The index links to section anchors, so headings get ids by converting through the section pages
+def markdown_to_indexed_html(readme_text, context=None, start_path=None, branch=None, prettify=False, section_cache=None, image_manifest=None, backend=None):
+    preamble, pages = markdown_to_pages(readme_text, context, start_path, branch, section_cache, image_manifest, backend)
+    html_content = '\n'.join(([preamble] if preamble else []) + [page['html'] for page in pages])
+    if prettify:
+        html_content = prettify_html(html_content)
+    return html_content, build_search_index(repository_name(start_path, context), preamble, pages)
+
+# Function to process the markdown file and write it out as HTML, local images resolved
+# against the repository the markdown file belongs to
+def process_markdown_to_html(input_file, output_file, context=None, branch=None, prettify=False, section_cache=None, image_manifest=None, backend=None, search_index_file=None):
+    with open(input_file, 'r') as file:
+        readme_text = file.read()
+
+    start_path = os.path.dirname(os.path.abspath(input_file))
+    if search_index_file is None:
+        html_content = markdown_to_html(readme_text, context, start_path, branch, prettify, section_cache, image_manifest, backend)
+    else:
+        html_content, search_index = markdown_to_indexed_html(readme_text, context, start_path, branch, prettify, section_cache, image_manifest, backend)
+        write_search_index(search_index, search_index_file)
+
     # Write the final HTML content to a new file
     with open(output_file, 'w') as file:
-        file.write(soup.prettify(formatter=None))
+        file.write(html_content)
 
     print(f"Conversion complete. The HTML content has been saved to {output_file}")
 
-# Example usage
-input_file = '../README.md'
-intermediate_file = 'Readme_converted.md'
-output_file = 'readme.html'
-process_markdown_to_html(input_file, intermediate_file, output_file)
\ No newline at end of file
+# Function to process the markdown file into an index page plus one HTML page per section
+def process_markdown_to_pages(input_file, output_dir, context=None, branch=None, section_cache=None, image_manifest=None, backend=None, search_index_file=None):
+    with open(input_file, 'r') as file:
+        readme_text = file.read()
+
+    start_path = os.path.dirname(os.path.abspath(input_file))
+    preamble, pages = markdown_to_pages(readme_text, context, start_path, branch, section_cache, image_manifest, backend)
+    written = write_pages(preamble, pages, output_dir)
+    if search_index_file is not None:
+        write_search_index(build_search_index(repository_name(start_path, context), preamble, pages, split=True), search_index_file)
+
+    print(f"Conversion complete. {len(pages)} section pages and the index have been saved to {output_dir}")
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert README.md to HTML")
+    parser.add_argument("input_file", nargs="?", default="../README.md")
+    parser.add_argument("output_file", nargs="?", default="readme.html")
+    parser.add_argument("--branch", help="Branch used for raw image URLs (default: the checked out branch)")
+    parser.add_argument("--backend", choices=sorted(MARKDOWN_BACKENDS), default=PythonMarkdownBackend.name, help="Markdown engine (default: %(default)s). gfm needs the cmarkgfm package")
+    parser.add_argument("--prettify", action="store_true", help="Re-indent the HTML with BeautifulSoup (slower, larger output)")
+    parser.add_argument("--section-cache", nargs="?", const=HTML_CACHE_DIR, metavar="DIR", help="Reuse cached HTML for unchanged sections (default dir: %(const)s)")
+    parser.add_argument("--image-manifest", nargs="?", const=IMAGE_MANIFEST_FILE, metavar="PATH", help="Add dimensions and lazy loading to images, caching what is read from local image files in PATH (default: %(const)s)")
+    parser.add_argument("--hash-image-urls", action="store_true", help="With --image-manifest, append a content hash to local image URLs so caches can keep them forever")
+    parser.add_argument("--precompress", action="store_true", help="Also write .gz/.br variants of the HTML and a manifest of their ETags and sizes")
+    parser.add_argument("--split-sections", metavar="DIR", help="Instead of one HTML file, write an index page, one page per top-level section and index.json to DIR")
+    parser.add_argument("--search-index", nargs="?", const=SEARCH_INDEX_FILE, metavar="PATH", help="Also write a search index shard of the README's sections to PATH (default: %(const)s) and give headings anchor ids")
+    args = parser.parse_args()
+
+    section_cache = SectionCache(args.section_cache) if args.section_cache else None
+    image_manifest = ImageManifest(args.image_manifest, args.hash_image_urls) if args.image_manifest else None
+    backend = create_backend(args.backend)
+    if args.split_sections:
+        written = process_markdown_to_pages(args.input_file, args.split_sections, branch=args.branch, section_cache=section_cache, image_manifest=image_manifest, backend=backend, search_index_file=args.search_index)
+    else:
+        process_markdown_to_html(args.input_file, args.output_file, branch=args.branch, prettify=args.prettify, section_cache=section_cache, image_manifest=image_manifest, backend=backend, search_index_file=args.search_index)
+        written = [args.output_file]
+    if image_manifest is not None:
+        image_manifest.save()
+    if args.precompress:
+        from precompress_html import precompress
+        for html_file in written:
+            precompress(html_file)
+    else:
+        for html_file in written:
+            remove_precompressed(html_file)
+    if section_cache is not None:
+        section_cache.evict()
+        section_cache.report()
@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import tempfile
+
+SEARCH_INDEX_VERSION = 1
+
+# Function to load a search index file, or None if it does not exist or cannot be read
+def load_index(index_file):
+    try:
+        with open(index_file, 'r') as file:
+            index = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+    return index if index.get('version') == SEARCH_INDEX_VERSION else None
+
+# Function to split a merged index back into one shard per repository, so that
+# repositories can be replaced one at a time
+def split_merged_index(merged):
+    shards = {}
+    locations = []
+    for section in merged['sections']:
+        shard = shards.setdefault(section['repository'], {
+            'version': SEARCH_INDEX_VERSION, 'repository': section['repository'], 'sections': [], 'terms': {},
+        })
+        locations.append((shard, len(shard['sections'])))
+        shard['sections'].append({key: value for key, value in section.items() if key != 'repository'})
+    for term, postings in merged['terms'].items():
+        for posting in postings:
+            shard, section_index = locations[posting[0]]
+            shard['terms'].setdefault(term, []).append([section_index] + posting[1:])
+    return shards
+
+# Function to merge repository shards into one index: every section tagged with its
+# repository, and every term's postings pointing at the merged section list
+def merge_shards(shards):
+    merged = {'version': SEARCH_INDEX_VERSION, 'repositories': [], 'sections': [], 'terms': {}}
+    for repository in sorted(shards):
+        shard = shards[repository]
+        offset = len(merged['sections'])
+        merged['repositories'].append(repository)
+        merged['sections'].extend(dict(section, repository=repository) for section in shard['sections'])
+        for term, postings in shard['terms'].items():
+            merged['terms'].setdefault(term, []).extend([posting[0] + offset] + posting[1:] for posting in postings)
+    return merged
+
+# Function to write the merged index through a temporary file, so the site never reads a partial index
+def write_index(index, index_file):
+    fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(index_file)), prefix='.search-index-')
+    with os.fdopen(fd, 'w') as file:
+        json.dump(index, file, ensure_ascii=False, separators=(',', ':'))
+    os.chmod(temp_file, 0o644)
+    os.replace(temp_file, index_file)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge per-repository search index shards into one search index")
+    parser.add_argument("output_file", help="Merged index; repositories already in it are kept unless a shard replaces them")
+    parser.add_argument("shards", nargs="*", help="Shards written by convert_readme_to_html.py --search-index")
+    args = parser.parse_args()
+
+    existing = load_index(args.output_file)
+    shards = split_merged_index(existing) if existing else {}
+    for shard_file in args.shards:
+        shard = load_index(shard_file)
+        if shard is None:
+            print(f"Skipping unreadable search index shard: {shard_file}")
+            continue
+        shards[shard['repository']] = shard
+
+    merged = merge_shards(shards)
+    write_index(merged, args.output_file)
+    print(f"Search index has been saved to {args.output_file}: {len(merged['repositories'])} repositories, {len(merged['sections'])} sections, {len(merged['terms'])} terms")
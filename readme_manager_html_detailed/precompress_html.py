@@ -0,0 +1,106 @@
+import argparse
+import gzip
+import hashlib
+import importlib.util
+import json
+import os
+import tempfile
+
+# Encodings written next to the HTML, by file suffix, for nginx gzip_static / brotli_static
+GZIP_SUFFIX = '.gz'
+BROTLI_SUFFIX = '.br'
+MANIFEST_SUFFIX = '.manifest.json'
+
+# Function to check whether the optional brotli package is installed
+def brotli_installed():
+    return importlib.util.find_spec('brotli') is not None
+
+# Function to compress with brotli if the optional brotli package is installed, else None
+def brotli_compress(data):
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+# Function to write bytes to a file through a temporary file, so readers never see a partial file
+def write_bytes(data, target_file):
+    fd, temp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(target_file)), prefix='.precompress-')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+        os.chmod(temp_file, 0o644)
+        os.replace(temp_file, target_file)
+    except BaseException:
+        os.unlink(temp_file)
+        raise
+
+# Function to describe an artifact by a strong ETag (derived from its content hash) and its size
+def describe(data):
+    digest = hashlib.sha256(data).hexdigest()
+    return {'etag': f'"{digest[:32]}"', 'sha256': digest, 'size': len(data)}
+
+# Function to load the manifest written by an earlier run, empty if absent or unreadable
+def load_manifest(manifest_file):
+    try:
+        with open(manifest_file, 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+# Function to check whether the manifest of an earlier run still describes the artifacts on disk
+# for this HTML, so they need not be compressed again
+def manifest_is_current(manifest, html_file, data, variants):
+    name = os.path.basename(html_file)
+    if sorted(manifest) != sorted(variants) or manifest[name].get('sha256') != hashlib.sha256(data).hexdigest():
+        return False
+    for variant in variants:
+        try:
+            size = os.path.getsize(os.path.join(os.path.dirname(html_file), variant))
+        except OSError:
+            return False
+        if size != manifest[variant].get('size'):
+            return False
+    return True
+
+# Function to write the .gz and .br variants of an HTML file plus a manifest of their ETags and sizes.
+# Output is deterministic (no timestamps), so unchanged HTML gives byte-identical artifacts, and
+# HTML the manifest already describes is not compressed again
+def precompress(html_file):
+    with open(html_file, 'rb') as file:
+        data = file.read()
+
+    name = os.path.basename(html_file)
+    if not brotli_installed() and os.path.exists(html_file + BROTLI_SUFFIX):
+        # A stale .br would be served in place of the new HTML, so drop it
+        print(f"brotli is not installed, removing stale {html_file + BROTLI_SUFFIX}")
+        os.remove(html_file + BROTLI_SUFFIX)
+
+    expected = [name, name + GZIP_SUFFIX] + ([name + BROTLI_SUFFIX] if brotli_installed() else [])
+    previous = load_manifest(html_file + MANIFEST_SUFFIX)
+    if manifest_is_current(previous, html_file, data, expected):
+        return previous
+
+    variants = {name: data, name + GZIP_SUFFIX: gzip.compress(data, 9, mtime=0)}
+    compressed = brotli_compress(data)
+    if compressed is not None:
+        variants[name + BROTLI_SUFFIX] = compressed
+
+    manifest = {}
+    for variant, content in variants.items():
+        if variant != name:
+            write_bytes(content, os.path.join(os.path.dirname(html_file), variant))
+        manifest[variant] = describe(content)
+
+    write_bytes((json.dumps(manifest, indent=2, sort_keys=True) + '\n').encode('utf-8'), html_file + MANIFEST_SUFFIX)
+    return manifest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write .gz/.br variants and an ETag manifest for HTML files")
+    parser.add_argument("html_files", nargs="+")
+    args = parser.parse_args()
+
+    for html_file in args.html_files:
+        manifest = precompress(html_file)
+        sizes = ", ".join(f"{variant} {entry['size']} bytes" for variant, entry in manifest.items())
+        print(f"Precompressed {html_file}: {sizes}")
@@ -1,21 +1,255 @@
 import requests
+import argparse
+import fcntl
+import hashlib
+import json
 import os
 import re
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext, redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from include_files import include_files
 
-# Define the main base README file and the new README file
-base_readme_file = os.path.join(os.path.dirname(__file__), "baseREADME.md")
-new_readme_file = os.path.join(os.path.dirname(__file__), "..", "README.md")
+# Define the main base README file and the project this copy of the script lives in
+base_readme_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseREADME.md")
+default_project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Project-relative include paths are written relative to <project>/readme_manager
+PROJECT_MANAGER_DIR = "readme_manager"
+LOCK_MANIFEST_NAME = "readme.lock.json"
+
+# Exit statuses: README.md already up to date and nothing was written, or a render failed
+UNCHANGED_EXIT_CODE = 3
+FAILED_EXIT_CODE = 1
+
+# Network settings for fetching remote includes
+FETCH_TIMEOUT = 15
+FETCH_RETRIES = 3
+FETCH_WORKERS = 8
+
+# Defaults for the on-disk cache of remote includes
+CACHE_DIR = os.environ.get("README_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "common_readme"))
+CACHE_TTL = 0
+CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# Raw URL prefix of this repository, served from a local checkout when one is given
+COMMON_README_RAW_URL = re.compile(r"^https://raw\.githubusercontent\.com/arpansahu/common_readme/[^/]+/(.+)$")
+
+# On-disk cache of remote includes keyed by URL, revalidated with conditional GETs. Several
+# renderers may share the cache directory: files are replaced atomically, and the index is
+# merged with what other processes saved while holding a lock on it
+class IncludeCache:
+    def __init__(self, cache_dir=CACHE_DIR, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES, offline=False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.index_file = os.path.join(cache_dir, "index.json")
+        self.lock_file = os.path.join(cache_dir, "index.lock")
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.entries = self.read_index()
+
+    def read_index(self):
+        try:
+            with open(self.index_file, "r") as index:
+                return json.load(index)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def body_path(self, url):
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    # Function to write a file in the cache directory through a temporary file, so readers
+    # in other processes see either the old or the new content
+    def write_file(self, target, text):
+        fd, temp_file = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as output:
+                output.write(text)
+            os.replace(temp_file, target)
+        except BaseException:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+
+    # Return (entry, body) for a cached URL, or (None, None) if it is not cached. Another process
+    # may have stored a newer body for the URL since the index was read, so the body must match the entry
+    def lookup(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+        if entry is None:
+            return None, None
+        try:
+            with open(self.body_path(url), "r", encoding="utf-8") as body_file:
+                body = body_file.read()
+        except FileNotFoundError:
+            body = None
+        if body is None or entry.get("sha256") != hash_text(body):
+            with self.lock:
+                self.entries.pop(url, None)
+            return None, None
+        return entry, body
+
+    def is_fresh(self, entry):
+        return self.ttl > 0 and time.time() - entry["fetched_at"] < self.ttl
+
+    def validators(self, entry):
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def record_hit(self, url, revalidated=False):
+        with self.lock:
+            entry = self.entries[url]
+            entry["last_used"] = time.time()
+            if revalidated:
+                entry["fetched_at"] = entry["last_used"]
+                self.revalidated += 1
+            else:
+                self.hits += 1
+
+    def store(self, url, response):
+        body = response.text
+        self.write_file(self.body_path(url), body)
+        now = time.time()
+        with self.lock:
+            self.misses += 1
+            self.entries[url] = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "fetched_at": now,
+                "last_used": now,
+                "size": len(body.encode("utf-8")),
+                "sha256": hash_text(body),
+            }
+        return body
+
+    # Function to merge the entries of this run into the index saved by other processes: the most
+    # recently fetched entry of a URL wins, and it keeps the latest use seen by either side
+    def merge(self, saved):
+        merged = dict(saved)
+        for url, entry in self.entries.items():
+            other = merged.get(url)
+            if other is None or entry["fetched_at"] >= other["fetched_at"]:
+                merged[url] = dict(entry, last_used=max(entry["last_used"], other["last_used"] if other else 0))
+            else:
+                merged[url] = dict(other, last_used=max(entry["last_used"], other["last_used"]))
+        return merged
+
+    # Drop least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        total = sum(entry["size"] for entry in self.entries.values())
+        for url, entry in sorted(self.entries.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            total -= entry["size"]
+            del self.entries[url]
+            try:
+                os.remove(self.body_path(url))
+            except FileNotFoundError:
+                pass
+
+    def save(self):
+        with self.lock, open(self.lock_file, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.entries = self.merge(self.read_index())
+            self.evict()
+            self.write_file(self.index_file, json.dumps(self.entries))
+
+    def report(self):
+        print(f"Include cache: {self.hits} hits, {self.revalidated} revalidated, {self.misses} misses")
+
+# Function to create a keep-alive session shared by all remote fetches
+def create_session(pool_size=FETCH_WORKERS, retries=FETCH_RETRIES):
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "HEAD"],
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Collects per-include and per-phase timings of a render as JSON lines records
+class RenderProfile:
+    def __init__(self):
+        self.records = []
+        self.project = None
+        self.lock = threading.Lock()
+
+    def record(self, event, **fields):
+        with self.lock:
+            self.records.append(dict(event=event, project=self.project, **fields))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record("phase", phase=name, seconds=round(time.perf_counter() - start, 6))
+
+    # Function to add the nesting depth to the include records of the placeholders resolved last
+    def record_depths(self, depths):
+        with self.lock:
+            for record in self.records:
+                if record["event"] == "include" and "depth" not in record and record["placeholder"] in depths:
+                    record["depth"] = depths[record["placeholder"]]
+
+    # Append the records to a file, or print them when the file is "-"
+    def write(self, output_file, stdout=None):
+        lines = "".join(json.dumps(record) + "\n" for record in self.records)
+        if output_file == "-":
+            (stdout or sys.stdout).write(lines)
+        else:
+            with open(output_file, "a") as output:
+                output.write(lines)
+
+# Function to time a phase when profiling is enabled
+def profile_phase(profile, name):
+    return profile.phase(name) if profile is not None else nullcontext()
 
 # Function to fetch content from a URL or local file
-def fetch_content(file_url):
+def fetch_content(file_url, session=None, timeout=FETCH_TIMEOUT, cache=None):
+    return fetch_source(file_url, session, timeout, cache)[0]
+
+# Function to fetch content and report where it came from: "remote", "cache" or "local"
+def fetch_source(file_url, session=None, timeout=FETCH_TIMEOUT, cache=None):
     print(f"Fetching content from: {file_url}")
     if file_url.startswith("http"):
+        entry, body = cache.lookup(file_url) if cache else (None, None)
+        if entry is not None and (cache.offline or cache.is_fresh(entry)):
+            cache.record_hit(file_url)
+            print(f"Using cached content for: {file_url}")
+            return body, "cache"
+        if cache is not None and cache.offline:
+            raise FileNotFoundError(f"Error fetching {file_url}: not in cache and running cache-only")
         try:
-            response = requests.get(file_url)
+            headers = cache.validators(entry) if entry is not None else {}
+            response = (session or requests).get(file_url, timeout=timeout, headers=headers)
+            if response.status_code == 304 and entry is not None:
+                cache.record_hit(file_url, revalidated=True)
+                print(f"Cached content still valid for: {file_url}")
+                return body, "cache"
             response.raise_for_status()
             print(f"Successfully fetched content from: {file_url}")
-            return response.text
+            return (cache.store(file_url, response) if cache else response.text), "remote"
         except requests.RequestException as e:
             print(f"Error fetching {file_url}: {e}")
             raise FileNotFoundError(f"Error fetching {file_url}: {e}")
@@ -23,58 +257,492 @@ def fetch_content(file_url):
         try:
             with open(file_url, "r") as local_file:
                 print(f"Successfully read local file: {file_url}")
-                return local_file.read()
+                return local_file.read(), "local"
         except FileNotFoundError as e:
             print(f"Error reading local file {file_url}: {e}")
             raise
 
-# Function to recursively replace placeholders
-def include_file_content(content, include_files):
-    placeholders_found = True
+# Function to point common_readme raw URLs at files in a local checkout, leaving external URLs untouched
+def resolve_local_includes(include_files, checkout_dir):
+    checkout_dir = os.path.abspath(checkout_dir)
+    resolved = {}
+    for placeholder, file_url in include_files.items():
+        match = COMMON_README_RAW_URL.match(file_url)
+        if match:
+            resolved[placeholder] = os.path.join(checkout_dir, *unquote(match.group(1)).split("/"))
+        else:
+            resolved[placeholder] = file_url
+    return resolved
+
+# Function to fetch the includes for a set of placeholders concurrently, each distinct source only once
+def prefetch_includes(placeholders, include_files, session, cache=None, max_workers=FETCH_WORKERS, profile=None, iteration=0):
+    sources = list(dict.fromkeys(include_files[placeholder] for placeholder in placeholders))
+
+    def timed_fetch(source):
+        start = time.perf_counter()
+        content, kind = fetch_source(source, session, cache=cache)
+        return content, kind, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(sources) or 1))) as executor:
+        fetched = dict(zip(sources, executor.map(timed_fetch, sources)))
+
+    if profile is not None:
+        for placeholder in placeholders:
+            content, kind, latency = fetched[include_files[placeholder]]
+            profile.record(
+                "include",
+                placeholder=placeholder,
+                source=include_files[placeholder],
+                type=kind,
+                latency_ms=round(latency * 1000, 3),
+                bytes=len(content.encode("utf-8")),
+                iteration=iteration,
+            )
+    return {placeholder: fetched[include_files[placeholder]][0] for placeholder in placeholders}
+
+# Raised when includes reference each other in a loop
+class IncludeCycleError(ValueError):
+    pass
+
+# Function to build one compiled matcher over every [KEY] tag in include_files
+def compile_placeholder_pattern(include_files):
+    # Longest keys first so a key that is a prefix of another never wins the match
+    keys = sorted(include_files, key=len, reverse=True)
+    return re.compile(r"\[(" + "|".join(re.escape(key) for key in keys) + r")\]")
+
+# Function to split content into literal text and placeholder keys in a single scan
+def tokenize_content(content, pattern):
+    tokens = []
+    position = 0
+    for match in pattern.finditer(content):
+        if match.start() > position:
+            tokens.append((False, content[position:match.start()]))
+        tokens.append((True, match.group(1)))
+        position = match.end()
+    if position < len(content):
+        tokens.append((False, content[position:]))
+    return tokens
+
+# Function to fetch every include reachable from the content, one nesting level per iteration
+# Placeholders listed in skip are left unresolved in the tokens
+def build_include_graph(content, include_files, pattern, session, cache=None, skip=(), profile=None):
+    root_tokens = tokenize_content(content, pattern)
+    documents = {}
+    graph = {}
+    digests = {}
+    level = [value for is_placeholder, value in root_tokens if is_placeholder and value not in skip]
     iteration = 0
 
-    while placeholders_found:
+    while level:
         print(f"Iteration {iteration}:")
-        placeholders_found = False
-        for placeholder, file_url in include_files.items():
-            placeholder_tag = f"[{placeholder}]"
-            if placeholder_tag in content:
-                placeholders_found = True
-                print(f"Found placeholder: {placeholder_tag}")
-                try:
-                    included_content = fetch_content(file_url)
-                    content = content.replace(placeholder_tag, included_content)
-                except FileNotFoundError as e:
-                    print(f"Stopping process due to missing file: {e}")
-                    return None
+        level = list(dict.fromkeys(level))
+        for placeholder in level:
+            print(f"Found placeholder: [{placeholder}]")
+        fetched = prefetch_includes(level, include_files, session, cache, profile=profile, iteration=iteration)
+
+        next_level = []
+        for placeholder in level:
+            digests[placeholder] = hash_text(fetched[placeholder])
+            tokens = tokenize_content(fetched[placeholder], pattern)
+            documents[placeholder] = tokens
+            graph[placeholder] = [value for is_placeholder, value in tokens if is_placeholder]
+            next_level.extend(graph[placeholder])
+        level = [placeholder for placeholder in next_level if placeholder not in documents and placeholder not in skip]
         iteration += 1
-    
-    return content
+
+    return root_tokens, documents, graph, digests
+
+# Function to fail loudly if the include graph contains a cycle
+def check_include_cycles(graph):
+    visiting, done = set(), set()
+
+    def visit(placeholder, path):
+        if placeholder in done:
+            return
+        if placeholder in visiting:
+            cycle = path[path.index(placeholder):] + [placeholder]
+            raise IncludeCycleError("Include cycle detected: " + " -> ".join(f"[{key}]" for key in cycle))
+        visiting.add(placeholder)
+        for child in graph.get(placeholder, []):
+            visit(child, path + [placeholder])
+        visiting.discard(placeholder)
+        done.add(placeholder)
+
+    for placeholder in graph:
+        visit(placeholder, [])
+
+# Function to find how deep each placeholder is nested: the longest chain of includes leading to it
+# from the content, whose own placeholders start at the depth given for them in root_depths (or 1)
+def include_depths(root_tokens, graph, root_depths=None):
+    depths = {}
+
+    def visit(placeholder, depth):
+        if depths.get(placeholder, 0) >= depth:
+            return
+        depths[placeholder] = depth
+        for child in graph.get(placeholder, []):
+            visit(child, depth + 1)
+
+    for is_placeholder, value in root_tokens:
+        if is_placeholder:
+            visit(value, (root_depths or {}).get(value, 1))
+    return depths
+
+# Function to splice resolved includes into the tokens, expanding each placeholder only once
+def splice_includes(tokens, documents, expanded):
+    parts = []
+    for is_placeholder, value in tokens:
+        if not is_placeholder:
+            parts.append(value)
+            continue
+        if value not in expanded:
+            expanded[value] = splice_includes(documents[value], documents, expanded)
+        parts.append(expanded[value])
+    return "".join(parts)
+
+# Function to fetch and tokenize every include reachable from the content, returning None if one is missing
+def resolve_includes(content, include_files, session=None, cache=None, profile=None, root_depths=None):
+    pattern = compile_placeholder_pattern(include_files)
+    http = session or create_session()
+    try:
+        root_tokens, documents, graph, digests = build_include_graph(content, include_files, pattern, http, cache, profile=profile)
+    except FileNotFoundError as e:
+        print(f"Stopping process due to missing file: {e}")
+        return None
+    finally:
+        if session is None:
+            http.close()
+
+    check_include_cycles(graph)
+    if profile is not None:
+        profile.record_depths(include_depths(root_tokens, graph, root_depths))
+    return root_tokens, documents, digests
+
+# Function to yield the expanded document chunk by chunk without building it in memory
+def iter_includes(tokens, documents):
+    for is_placeholder, value in tokens:
+        if is_placeholder:
+            yield from iter_includes(documents[value], documents)
+        else:
+            yield value
+
+# Function to replace all placeholders, including nested ones, in a single pass
+def include_file_content(content, include_files, session=None, cache=None):
+    resolved = resolve_includes(content, include_files, session, cache)
+    if resolved is None:
+        return None
+    root_tokens, documents, _ = resolved
+    return splice_includes(root_tokens, documents, {})
+
+# Function to list the placeholders that come from the project itself rather than common_readme
+def project_slots(include_files):
+    return {
+        placeholder for placeholder, file_url in include_files.items()
+        if not file_url.startswith("http") and not os.path.isabs(file_url)
+    }
+
+# Function to inline resolved common includes, leaving only literal segments and project slots
+def flatten_template(tokens, documents, flattened):
+    segments = []
+    literal = []
+    for is_placeholder, value in tokens:
+        if is_placeholder and value in documents:
+            if value not in flattened:
+                flattened[value] = flatten_template(documents[value], documents, flattened)
+            parts = flattened[value]
+        else:
+            parts = [(is_placeholder, value)]
+        for is_slot, part in parts:
+            if is_slot:
+                if literal:
+                    segments.append((False, "".join(literal)))
+                    literal = []
+                segments.append((True, part))
+            else:
+                literal.append(part)
+    if literal:
+        segments.append((False, "".join(literal)))
+    return segments
+
+# Function to expand the base README and all common includes once into a reusable template
+def compile_template(content, include_files, slots, session=None, cache=None, profile=None):
+    pattern = compile_placeholder_pattern(include_files)
+    http = session or create_session()
+    try:
+        root_tokens, documents, graph, digests = build_include_graph(content, include_files, pattern, http, cache, slots, profile)
+    except FileNotFoundError as e:
+        print(f"Stopping process due to missing file: {e}")
+        return None
+    finally:
+        if session is None:
+            http.close()
+
+    check_include_cycles(graph)
+    depths = include_depths(root_tokens, graph)
+    if profile is not None:
+        profile.record_depths(depths)
+    return {
+        "version": 1,
+        "base": hash_text(content),
+        "digests": digests,
+        "segments": flatten_template(root_tokens, documents, {}),
+        "slot_depths": {slot: depths[slot] for slot in slots if slot in depths},
+    }
+
+# Function to resolve only the project slots of a compiled template
+def fill_template(template, include_files, session=None, cache=None, profile=None):
+    slots = dict.fromkeys(value for is_slot, value in template["segments"] if is_slot)
+    resolved = resolve_includes("".join(f"[{slot}]" for slot in slots), include_files, session, cache, profile, template.get("slot_depths"))
+    if resolved is None:
+        return None
+    _, documents, digests = resolved
+    return template["segments"], documents, dict(template["digests"], **digests)
+
+def save_template(template, template_file):
+    with open(template_file, "w") as output:
+        json.dump(template, output)
+
+def load_template(template_file):
+    with open(template_file, "r") as template_input:
+        template = json.load(template_input)
+    template["segments"] = [(is_slot, value) for is_slot, value in template["segments"]]
+    return template
+
+# Function to hash text for the lock manifest
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# Function to describe the inputs of a render: the base template and every resolved include
+def build_lock_manifest(base_content, digests):
+    return {"base": hash_text(base_content), "includes": dict(sorted(digests.items()))}
+
+# Function to check whether the last written README was rendered from exactly these inputs
+def lock_is_current(manifest, manifest_file, readme_file):
+    try:
+        with open(manifest_file, "r") as lock_file:
+            previous = json.load(lock_file)
+        with open(readme_file, "r") as readme:
+            output_hash = hash_text(readme.read())
+    except (FileNotFoundError, ValueError):
+        return False
+    return previous.get("output") == output_hash and {key: previous.get(key) for key in manifest} == manifest
+
+# Function to write the lock manifest after a successful render
+def write_lock_manifest(manifest, manifest_file, output_hash):
+    manifest = dict(manifest, output=output_hash)
+    with open(manifest_file, "w") as lock_file:
+        json.dump(manifest, lock_file, indent=2)
+        lock_file.write("\n")
+
+# Function to drop lines containing '# Ignore this line' from a stream of chunks
+def filter_ignore_lines(chunks, marker="# Ignore this line"):
+    pending = ""
+    separator = ""
+    for chunk in chunks:
+        pending += chunk
+        end = pending.rfind("\n")
+        if end < 0:
+            continue
+        block, pending = pending[:end], pending[end + 1:]
+        if marker in block:
+            kept = [line for line in block.split("\n") if marker not in line]
+            if not kept:
+                continue
+            block = "\n".join(kept)
+        yield separator + block
+        separator = "\n"
+    if marker not in pending:
+        yield separator + pending
 
 # Function to remove lines containing '# Ignore this line'
 def remove_ignore_lines(content):
-    lines = content.split('\n')
-    filtered_lines = [line for line in lines if '# Ignore this line' not in line]
-    return '\n'.join(filtered_lines)
-
-# Check if the base README file exists
-if not os.path.exists(base_readme_file):
-    print(f"Error: The base README file '{base_readme_file}' does not exist.")
-else:
-    # Read the base README file content
-    with open(base_readme_file, "r") as base_file:
-        readme_content = base_file.read()
+    return "".join(filter_ignore_lines([content]))
 
-    # Replace all placeholders with their corresponding file content from GitHub or local files
-    readme_content = include_file_content(readme_content, include_files)
+# Function to write chunks to a temporary file and atomically move it over the target, returning its hash
+def write_atomically(chunks, target_file):
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(target_file))
+    with tempfile.NamedTemporaryFile("w", dir=directory, prefix=".README.", suffix=".tmp", delete=False) as temp_file:
+        try:
+            for chunk in chunks:
+                temp_file.write(chunk)
+                digest.update(chunk.encode("utf-8"))
+        except BaseException:
+            temp_file.close()
+            os.remove(temp_file.name)
+            raise
+    # Temporary files are created private, keep the permissions a plain write would have given
+    os.chmod(temp_file.name, os.stat(target_file).st_mode & 0o7777 if os.path.exists(target_file) else 0o644)
+    os.replace(temp_file.name, target_file)
+    return digest.hexdigest()
 
-    if readme_content is not None:
-        # Remove lines containing '# Ignore this line'
-        readme_content = remove_ignore_lines(readme_content)
+# Function to point project-relative includes at files under a project root
+def resolve_project_includes(include_files, root_dir):
+    manager_dir = os.path.join(os.path.abspath(root_dir), PROJECT_MANAGER_DIR)
+    slots = project_slots(include_files)
+    return {
+        placeholder: os.path.normpath(os.path.join(manager_dir, file_url)) if placeholder in slots else file_url
+        for placeholder, file_url in include_files.items()
+    }
 
-        # Write the updated content to the new README file
-        with open(new_readme_file, "w") as new_file:
-            new_file.write(readme_content)
-        print("README.md has been created with the referenced content.")
+# Function to fetch everything a project's README needs, raising FileNotFoundError if an include is missing
+def resolve_render(base_template, include_map, root_dir, session=None, cache=None, template=None, profile=None):
+    project_includes = resolve_project_includes(include_map, root_dir)
+    if template is not None and template["base"] == hash_text(base_template):
+        resolved = fill_template(template, project_includes, session, cache, profile)
     else:
-        print("Process stopped due to missing file.")
\ No newline at end of file
+        resolved = resolve_includes(base_template, project_includes, session, cache, profile)
+    if resolved is None:
+        raise FileNotFoundError(f"Missing include while rendering {root_dir}")
+    return resolved
+
+# Function to yield the README for a project root chunk by chunk, ignore lines already removed
+def render_stream(base_template, include_map, root_dir, session=None, cache=None, template=None):
+    root_tokens, documents, _ = resolve_render(base_template, include_map, root_dir, session, cache, template)
+    return filter_ignore_lines(iter_includes(root_tokens, documents))
+
+# Function to render the README for a project root without touching the filesystem outside reads
+def render(base_template, include_map, root_dir, session=None, cache=None, template=None):
+    return "".join(render_stream(base_template, include_map, root_dir, session, cache, template))
+
+# Function to regenerate README.md of one project, returning 0, UNCHANGED_EXIT_CODE or FAILED_EXIT_CODE
+def update_project_readme(base_template, include_map, root_dir, session, cache=None, template=None, force=False, profile=None):
+    readme_file = os.path.join(root_dir, "README.md")
+    manifest_file = os.path.join(root_dir, PROJECT_MANAGER_DIR, LOCK_MANIFEST_NAME)
+    if profile is not None:
+        profile.project = root_dir
+    try:
+        with profile_phase(profile, "resolve"):
+            root_tokens, documents, digests = resolve_render(base_template, include_map, root_dir, session, cache, template, profile)
+    except FileNotFoundError:
+        print(f"Process stopped due to missing file in {root_dir}.")
+        return FAILED_EXIT_CODE
+    except IncludeCycleError as e:
+        print(f"Process stopped in {root_dir}: {e}")
+        return FAILED_EXIT_CODE
+
+    # Skip expansion and the write when nothing changed since the last render
+    manifest = build_lock_manifest(base_template, digests)
+    if not force and lock_is_current(manifest, manifest_file, readme_file):
+        print(f"{readme_file} is up to date with the lock manifest, nothing to do.")
+        return UNCHANGED_EXIT_CODE
+
+    # Stream the expansion, minus lines containing '# Ignore this line', into the new README file
+    with profile_phase(profile, "render"):
+        output_hash = write_atomically(filter_ignore_lines(iter_includes(root_tokens, documents)), readme_file)
+    if os.path.isdir(os.path.dirname(manifest_file)):
+        write_lock_manifest(manifest, manifest_file, output_hash)
+    print(f"{readme_file} has been created with the referenced content.")
+    return 0
+
+# Function to read the base README file, or None if it does not exist. When this script runs from
+# the fleet's zipapp, baseREADME.md is bundled next to it inside the archive
+def read_base_readme(base_file=base_readme_file):
+    if os.path.exists(base_file):
+        with open(base_file, "r") as file:
+            return file.read()
+    try:
+        return __loader__.get_data(base_file).decode("utf-8")
+    except OSError:
+        return None
+
+# Function to persist the include cache and print its statistics
+def finish_cache(cache):
+    if cache is not None:
+        cache.save()
+        cache.report()
+
+# Function to parse the command line options
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build README.md from baseREADME.md and the include files")
+    parser.add_argument("roots", nargs="*", help="Project roots to render (default: the project this script lives in)")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="Directory for the remote include cache")
+    parser.add_argument("--cache-ttl", type=int, default=CACHE_TTL, help="Seconds a cached include is used without revalidating")
+    parser.add_argument("--cache-max-mb", type=int, default=CACHE_MAX_BYTES // (1024 * 1024), help="Size cap of the include cache in MB")
+    parser.add_argument("--cache-only", action="store_true", help="Never touch the network, use cached includes only")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the include cache")
+    parser.add_argument("--force", action="store_true", help="Regenerate README.md even if the lock manifest matches")
+    parser.add_argument("--compile-template", metavar="PATH", help="Expand baseREADME.md and all common includes into a template file and exit")
+    parser.add_argument("--template", metavar="PATH", help="Render from a compiled template, resolving only the project slots")
+    parser.add_argument("--local-checkout", help="Path to a common_readme checkout to read common includes from instead of GitHub")
+    parser.add_argument("--profile", metavar="PATH", help="Append a JSON lines trace of include fetches and phase timings to PATH ('-' for stdout)")
+    return parser.parse_args(argv)
+
+# Function to render the READMEs of the requested project roots, returning the exit status. A
+# trace written to "-" goes to trace_stdout
+def run(args, trace_stdout=None):
+    # Read the base README file content
+    readme_content = read_base_readme()
+    if readme_content is None:
+        print(f"Error: The base README file '{base_readme_file}' does not exist.")
+        return FAILED_EXIT_CODE
+
+    cache = None
+    if not args.no_cache:
+        cache = IncludeCache(args.cache_dir, args.cache_ttl, args.cache_max_mb * 1024 * 1024, args.cache_only)
+
+    # Read common includes from the local checkout when one is given
+    sources = include_files
+    if args.local_checkout:
+        sources = resolve_local_includes(include_files, args.local_checkout)
+
+    roots = args.roots or [default_project_root]
+    profile = RenderProfile() if args.profile else None
+    session = create_session()
+    start = time.perf_counter()
+    try:
+        # Expand the common part of the README once, every project then only fills its own slots
+        template = None
+        if args.compile_template or (len(roots) > 1 and not args.template):
+            try:
+                with profile_phase(profile, "compile"):
+                    template = compile_template(readme_content, sources, project_slots(include_files), session, cache, profile)
+            except IncludeCycleError as e:
+                finish_cache(cache)
+                print(f"Process stopped: {e}")
+                return FAILED_EXIT_CODE
+            if template is None:
+                finish_cache(cache)
+                print("Process stopped due to missing file.")
+                return FAILED_EXIT_CODE
+        if args.compile_template:
+            save_template(template, args.compile_template)
+            print(f"Compiled template has been written to {args.compile_template}.")
+            finish_cache(cache)
+            return 0
+
+        if args.template:
+            template = load_template(args.template)
+            if template["base"] != hash_text(readme_content):
+                print(f"Compiled template {args.template} is out of date with baseREADME.md, expanding in full.")
+
+        statuses = {}
+        for root_dir in roots:
+            statuses[root_dir] = update_project_readme(readme_content, sources, root_dir, session, cache, template, args.force, profile)
+    finally:
+        session.close()
+        if profile is not None:
+            profile.project = None
+            profile.record("phase", phase="total", seconds=round(time.perf_counter() - start, 6))
+            profile.write(args.profile, trace_stdout)
+    finish_cache(cache)
+
+    if len(roots) > 1:
+        for root_dir, status in statuses.items():
+            print(f"{root_dir}: {({0: 'updated', UNCHANGED_EXIT_CODE: 'unchanged'}).get(status, 'failed')}")
+    if FAILED_EXIT_CODE in statuses.values():
+        return FAILED_EXIT_CODE
+    if all(status == UNCHANGED_EXIT_CODE for status in statuses.values()):
+        return UNCHANGED_EXIT_CODE
+    return 0
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # With the trace on stdout, progress messages go to stderr so that stdout stays JSON lines
+    trace_stdout = sys.stdout
+    with redirect_stdout(sys.stderr) if args.profile == "-" else nullcontext():
+        return run(args, trace_stdout)
+
+if __name__ == "__main__":
+    sys.exit(main())
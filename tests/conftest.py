@@ -0,0 +1,101 @@
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "readme_manager_html_detailed"))
+
+# Serves a fixed set of documents on localhost, counting requests and the most requests in flight
+# at once. A path listed in failures answers 503 that many times before it succeeds
+class StubServer:
+    def __init__(self, documents, latency=0.0, failures=None, etags=None):
+        self.documents = documents
+        self.latency = latency
+        self.failures = dict(failures or {})
+        self.etags = dict(etags or {})
+        self.requests = {}
+        self.methods = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def respond(self, send_body):
+                with stub.lock:
+                    stub.requests[self.path] = stub.requests.get(self.path, 0) + 1
+                    stub.methods.append(self.command)
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    failing = stub.failures.get(self.path, 0) > 0
+                    if failing:
+                        stub.failures[self.path] -= 1
+                try:
+                    time.sleep(stub.latency)
+                    body = stub.documents.get(self.path)
+                    etag = stub.etags.get(self.path)
+                    if failing or body is None:
+                        self.send_response(503 if failing else 404)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    if etag is not None and self.headers.get("If-None-Match") == etag:
+                        self.send_response(304)
+                        self.send_header("ETag", etag)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    data = body.encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; charset=utf-8")
+                    self.send_header("Content-Length", str(len(data)))
+                    if etag is not None:
+                        self.send_header("ETag", etag)
+                    self.end_headers()
+                    if send_body:
+                        self.wfile.write(data)
+                finally:
+                    with stub.lock:
+                        stub.in_flight -= 1
+
+            def do_GET(self):
+                self.respond(True)
+
+            def do_HEAD(self):
+                self.respond(False)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stub_server():
+    servers = []
+
+    def start(documents, **options):
+        server = StubServer(documents, **options).__enter__()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.__exit__(None, None, None)
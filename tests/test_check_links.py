@@ -0,0 +1,90 @@
+import check_links
+import readme_updater
+
+def check(links, cache=None):
+    session = readme_updater.create_session(retries=0)
+    try:
+        return check_links.check_links(links, session, cache, max_workers=4, timeout=5)
+    finally:
+        session.close()
+
+def test_reports_working_and_broken_links(stub_server, tmp_path):
+    stub = stub_server({"/ok.md": "ok\n", "/image.png": "png"})
+    image = tmp_path / "local.png"
+    image.write_bytes(b"png")
+    links = [
+        (f"{stub.url}/ok.md", "include [OK]"),
+        (f"{stub.url}/image.png", "README.md:3"),
+        (f"{stub.url}/image.png", "README.md:9"),
+        (f"{stub.url}/missing.md", "include [MISSING]"),
+        (str(image), "README.md:5"),
+        (str(tmp_path / "gone.png"), "README.md:7"),
+    ]
+
+    results = check(links)
+    report = check_links.build_report(links, results, 0.1)
+
+    assert {target: result["ok"] for target, result in results.items()} == {
+        f"{stub.url}/ok.md": True,
+        f"{stub.url}/image.png": True,
+        f"{stub.url}/missing.md": False,
+        str(image): True,
+        str(tmp_path / "gone.png"): False,
+    }
+    assert results[f"{stub.url}/missing.md"]["status"] == 404
+    assert (report["links"], report["targets"], report["broken"]) == (6, 5, 2)
+    assert next(entry for entry in report["results"] if entry["target"] == f"{stub.url}/image.png")["sources"] == ["README.md:3", "README.md:9"]
+    assert stub.requests["/image.png"] == 1
+    assert set(stub.methods) == {"HEAD"}
+
+def test_checks_run_concurrently(stub_server):
+    stub = stub_server({f"/doc_{index}.md": "doc\n" for index in range(8)}, latency=0.2)
+    links = [(f"{stub.url}/doc_{index}.md", "include") for index in range(8)]
+
+    check(links)
+
+    assert stub.max_in_flight > 1
+
+def test_cached_results_are_reused_then_revalidated(stub_server, tmp_path):
+    stub = stub_server({"/doc.md": "doc\n"}, etags={"/doc.md": '"v1"'})
+    links = [(f"{stub.url}/doc.md", "include [DOC]")]
+    cache_file = str(tmp_path / "links.json")
+
+    cache = check_links.LinkCache(cache_file, ttl=3600)
+    assert check(links, cache)[f"{stub.url}/doc.md"]["cached"] is False
+    cache.save()
+
+    fresh = check(links, check_links.LinkCache(cache_file, ttl=3600))
+    assert fresh[f"{stub.url}/doc.md"]["cached"] is True
+    assert stub.requests["/doc.md"] == 1
+
+    stale = check(links, check_links.LinkCache(cache_file, ttl=0))
+    assert stale[f"{stub.url}/doc.md"]["ok"] is True
+    assert stale[f"{stub.url}/doc.md"]["status"] == 304
+    assert stub.requests["/doc.md"] == 2
+
+def test_broken_links_are_always_checked_again(stub_server, tmp_path):
+    stub = stub_server({})
+    links = [(f"{stub.url}/missing.md", "include")]
+    cache = check_links.LinkCache(str(tmp_path / "links.json"), ttl=3600)
+
+    check(links, cache)
+    check(links, cache)
+
+    assert stub.requests["/missing.md"] == 2
+
+def test_collects_images_outside_code_fences(tmp_path):
+    readme = tmp_path / "README.md"
+    readme.write_text(
+        "![Diagram](images/diagram%201.png)\n"
+        "```\n![Not an image](ignored.png)\n```\n"
+        '<img src="https://example.com/shot.png" width="300">\n'
+        "![Inline](data:image/png;base64,AAAA)\n"
+    )
+
+    links = check_links.collect_image_links([str(readme)])
+
+    assert links == [
+        (str(tmp_path / "images" / "diagram 1.png"), f"{readme}:1"),
+        ("https://example.com/shot.png", f"{readme}:5"),
+    ]
@@ -0,0 +1,132 @@
+import glob
+import json
+import os
+import struct
+import sys
+
+import pytest
+
+import convert_readme_to_html
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import compare_backends
+
+def test_section_titled_index_does_not_replace_the_toc_page(tmp_path):
+    preamble, pages = convert_readme_to_html.markdown_to_pages("intro\n\n## Index\n\nindex section\n\n## Setup\n\nsetup section\n")
+
+    convert_readme_to_html.write_pages(preamble, pages, str(tmp_path))
+
+    assert [page["slug"] for page in pages] == ["index-1", "setup"]
+    assert "readme-toc" in (tmp_path / "index.html").read_text()
+    assert "index section" in (tmp_path / "index-1.html").read_text()
+    with open(os.path.join(tmp_path, "index.json")) as index_file:
+        assert [entry["file"] for entry in json.load(index_file)["sections"]] == ["index-1.html", "setup.html"]
+
+def test_gfm_backend_renders_the_golden_corpus():
+    pytest.importorskip("cmarkgfm")
+    gfm = convert_readme_to_html.create_backend("gfm")
+    for markdown_file in sorted(glob.glob(os.path.join(compare_backends.CORPUS_DIR, "*.md"))):
+        with open(markdown_file) as file:
+            text = file.read()
+        with open(os.path.splitext(markdown_file)[0] + ".html") as file:
+            golden = file.read()
+        assert compare_backends.normalize(gfm.convert(text)) == compare_backends.normalize(golden), markdown_file
+
+def jpeg(frame_marker, width, height):
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00" + bytes(9)
+    dht = b"\xff\xc4" + struct.pack(">H", 5) + bytes(3)
+    frame = bytes([0xff, frame_marker]) + struct.pack(">HBHHB", 11, 8, height, width, 1) + bytes(3)
+    return b"\xff\xd8" + app0 + dht + frame + b"\xff\xda"
+
+def webp(chunk, payload):
+    return b"RIFF" + struct.pack("<I", 4 + 8 + len(payload)) + b"WEBP" + chunk + struct.pack("<I", len(payload)) + payload
+
+IMAGES = {
+    "png": (b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">IIBBBBB", 640, 480, 8, 6, 0, 0, 0), (640, 480)),
+    "gif": (b"GIF89a" + struct.pack("<HH", 32, 16) + bytes(3), (32, 16)),
+    "jpeg_sof0": (jpeg(0xc0, 1024, 768), (1024, 768)),
+    "jpeg_sof2": (jpeg(0xc2, 300, 200), (300, 200)),
+    "webp_vp8": (webp(b"VP8 ", b"\x30\x01\x00\x9d\x01\x2a" + struct.pack("<HH", 400, 300) + bytes(4)), (400, 300)),
+    "webp_vp8l": (webp(b"VP8L", b"\x2f" + struct.pack("<I", (120 - 1) | (90 - 1) << 14) + bytes(4)), (120, 90)),
+    "webp_vp8x": (webp(b"VP8X", bytes(4) + (2000 - 1).to_bytes(3, "little") + (1000 - 1).to_bytes(3, "little")), (2000, 1000)),
+}
+
+@pytest.mark.parametrize("name", sorted(IMAGES))
+def test_read_image_size(name):
+    data, size = IMAGES[name]
+    assert tuple(convert_readme_to_html.read_image_size(data)) == size
+
+@pytest.mark.parametrize("name", sorted(IMAGES))
+def test_truncated_image_has_no_size(name):
+    data, size = IMAGES[name]
+    # Cut anywhere, the header gives no size until the dimensions are complete
+    for length in range(len(data)):
+        result = convert_readme_to_html.read_image_size(data[:length])
+        assert result is None or tuple(result) == size, length
+    assert convert_readme_to_html.read_image_size(data[:len(data) // 2]) is None
+    assert convert_readme_to_html.read_image_size(b"GIF89a") is None
+
+def test_image_manifest_is_reused_until_the_image_changes(tmp_path, monkeypatch):
+    image = tmp_path / "diagram.png"
+    image.write_bytes(IMAGES["png"][0])
+    manifest_file = str(tmp_path / convert_readme_to_html.IMAGE_MANIFEST_FILE)
+    manifest = convert_readme_to_html.ImageManifest(manifest_file)
+    entry = manifest.describe(str(image))
+    manifest.save()
+    assert (entry["width"], entry["height"]) == (640, 480)
+
+    # A second run reads the manifest instead of the image
+    def read_image_size(data):
+        raise AssertionError("image read again")
+
+    monkeypatch.setattr(convert_readme_to_html, "read_image_size", read_image_size)
+    assert convert_readme_to_html.ImageManifest(manifest_file).describe(str(image)) == entry
+
+    monkeypatch.undo()
+    image.write_bytes(IMAGES["gif"][0])
+    changed = convert_readme_to_html.ImageManifest(manifest_file).describe(str(image))
+    assert (changed["width"], changed["height"]) == (32, 16)
+    assert changed["sha256"] != entry["sha256"]
+
+def test_truncated_image_does_not_stop_the_conversion(tmp_path):
+    (tmp_path / "Images").mkdir()
+    (tmp_path / "Images" / "broken.gif").write_bytes(b"GIF89a")
+    context = convert_readme_to_html.RepositoryContext("https://github.com/user/repo", "main", str(tmp_path))
+    manifest = convert_readme_to_html.ImageManifest(str(tmp_path / "manifest.json"))
+
+    html_content = convert_readme_to_html.markdown_to_html("![Broken](Images/broken.gif)\n", context, image_manifest=manifest)
+
+    assert 'src="https://raw.githubusercontent.com/user/repo/main/Images/broken.gif"' in html_content
+    assert "width=" not in html_content
+
+SECTIONED_DOCUMENTS = {
+    "headings_in_fences": "# Title\n\nintro\n\n```bash\n# not a heading\n\n## nor this\n```\n\n## Setup\n\n~~~\n# comment\n~~~\n\ntext\n",
+    "html_block_spanning_headings": "# Title\n\n<details>\n<summary>More</summary>\n\n## Inside\n\ntext\n\n</details>\n\n## After\n\n<!-- a comment\n\n## hidden heading\n-->\n\nend\n",
+    "reference_links": "# Title\n\nSee [the guide][guide] and [^1].\n\n## Links\n\n[guide]: https://example.com/guide\n[^1]: A footnote.\n",
+    "plain_sections": "intro\n\n# One\n\nfirst\n\n## Two\n\n- a\n- b\n\n## Three\n\n| a | b |\n|---|---|\n| 1 | 2 |\n",
+}
+
+@pytest.mark.parametrize("name", sorted(SECTIONED_DOCUMENTS))
+def test_sectioned_conversion_matches_the_whole_document(name, tmp_path):
+    text = SECTIONED_DOCUMENTS[name]
+    whole = convert_readme_to_html.PythonMarkdownBackend().convert(text)
+    cache = convert_readme_to_html.SectionCache(str(tmp_path / "sections"))
+
+    first = convert_readme_to_html.convert_sections(text, cache)
+    misses = cache.misses
+    second = convert_readme_to_html.convert_sections(text, cache)
+
+    assert compare_backends.normalize(first) == compare_backends.normalize(whole)
+    assert second == first
+    assert (cache.hits, cache.misses) == (misses, misses)
+    # Reference definitions can point across sections, so such documents are converted whole
+    assert (misses == 0) == (name == "reference_links")
+
+def test_sections_are_split_outside_fences_and_open_html_blocks():
+    backend = convert_readme_to_html.PythonMarkdownBackend()
+    sections = convert_readme_to_html.split_sections(SECTIONED_DOCUMENTS["headings_in_fences"])
+    assert [section.split("\n", 1)[0] for section in sections] == ["# Title", "## Setup"]
+
+    sections = convert_readme_to_html.merge_open_html_sections(
+        convert_readme_to_html.split_sections(SECTIONED_DOCUMENTS["html_block_spanning_headings"]), backend.block_level_elements)
+    assert [section.split("\n", 1)[0] for section in sections] == ["# Title", "## After"]
@@ -0,0 +1,187 @@
+import subprocess
+
+import pytest
+
+import fleet_runner
+
+# update_readme.sh stand-ins, run from the root of each checkout like the real script
+UPDATE_SCRIPTS = {
+    "changed": 'echo "# Updated by the fleet" > README.md\n',
+    "same": 'echo "# Original" > README.md\n',
+    "locked": "exit 3\n",
+    "broken": 'echo "render failed" >&2\nexit 1\n',
+    "hidden": 'python3 -c "raise SystemExit(1)"\necho "cleaning up"\n',
+    "slow": "sleep 60\n",
+}
+
+def git(*args, cwd=None):
+    return subprocess.run(["git"] + list(args), cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+@pytest.fixture(autouse=True)
+def git_identity(monkeypatch):
+    for variable in ("GIT_AUTHOR_NAME", "GIT_COMMITTER_NAME"):
+        monkeypatch.setenv(variable, "Fleet Test")
+    for variable in ("GIT_AUTHOR_EMAIL", "GIT_COMMITTER_EMAIL"):
+        monkeypatch.setenv(variable, "fleet@example.com")
+
+# Creates a bare repository with a README.md, a readme_manager/update_readme.sh running the
+# given script and any other files given, and returns its path
+def create_repo(root, name, script, files=None):
+    source = root / "sources" / name
+    source.mkdir(parents=True)
+    git("init", "--quiet", "-b", "main", cwd=source)
+    (source / "README.md").write_text("# Original\n")
+    (source / "readme_manager").mkdir()
+    (source / "readme_manager" / "update_readme.sh").write_text(script)
+    for path, content in (files or {}).items():
+        (source / path).parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(content, bytes):
+            (source / path).write_bytes(content)
+        else:
+            (source / path).write_text(content)
+    git("add", "-A", cwd=source)
+    git("commit", "--quiet", "-m", "Initial commit", cwd=source)
+    bare = root / "remotes" / f"{name}.git"
+    git("clone", "--quiet", "--bare", str(source), str(bare))
+    return bare
+
+@pytest.fixture
+def fleet(tmp_path, monkeypatch):
+    monkeypatch.setattr(fleet_runner, "include_sources", lambda include_map=None: [])
+    repos = {name: create_repo(tmp_path, name, script) for name, script in UPDATE_SCRIPTS.items()}
+    repos["portfolio"] = create_repo(tmp_path, "portfolio", "exit 3\n", {fleet_runner.HTML_SCRIPT_PATH: "exit 0\n"})
+    repos["latin1"] = create_repo(tmp_path, "latin1", "exit 3\n", {fleet_runner.HTML_SCRIPT_PATH: "exit 0\n", "README.md": "# Caf\xe9\n".encode("latin-1")})
+    common = create_repo(tmp_path, "common_readme", "exit 0\n")
+
+    # Runs the readme stage over the given repositories and returns their results by name.
+    # Unless zipapp is set, each repository's update_readme.sh renders its README
+    def run(names, *extra, zipapp=False):
+        repos_file = tmp_path / "repos_list.sh"
+        urls = [str(repos[name]) if name in repos else str(tmp_path / "remotes" / f"{name}.git") for name in names]
+        repos_file.write_text("REPOS=(\n" + "".join(f'    "{url}"\n' for url in urls) + ")\n")
+        results = []
+        monkeypatch.setattr(fleet_runner, "print_summary", lambda summary, stages: results.extend(summary))
+        status = fleet_runner.main([
+            "local", "--stages", "readme", "--repos-file", str(repos_file), "--zipapp-dir", str(tmp_path / "artifacts"),
+            "--work-dir", str(tmp_path / "work"), "--log-dir", str(tmp_path / "logs"),
+            "--mirror-dir", str(tmp_path / "mirrors"), "--section-cache-dir", str(tmp_path / "sections"), "--state-file", str(tmp_path / "state.sqlite3"),
+            "--common-readme-url", str(common), "--portfolio-url", str(repos["portfolio"]),
+        ] + ([] if zipapp else ["--no-zipapp"]) + list(extra))
+        return status, {result.name: result for result in results}
+
+    run.repos = repos
+    (tmp_path / "work").mkdir()
+    return run
+
+def test_changed_repository_is_pushed(fleet):
+    status, results = fleet(["changed"], "--no-state")
+
+    assert status == 0
+    assert results["changed"].stages["readme"] == (fleet_runner.CHANGED, "pushed README.md")
+    bare = fleet.repos["changed"]
+    assert git("show", "main:README.md", cwd=bare) == "# Updated by the fleet"
+    assert git("log", "-1", "--format=%s", "main", cwd=bare) == "Automatic Update README.md"
+    assert results["changed"].repo_sha == git("rev-parse", "main", cwd=bare)
+
+def test_unchanged_repositories_are_not_pushed(fleet):
+    heads = {name: git("rev-parse", "main", cwd=fleet.repos[name]) for name in ("same", "locked")}
+
+    status, results = fleet(["same", "locked"], "--no-state")
+
+    assert status == 0
+    assert results["same"].stages["readme"] == (fleet_runner.UNCHANGED, "README.md not changed")
+    assert results["locked"].stages["readme"] == (fleet_runner.UNCHANGED, "lock manifest up to date")
+    assert {name: git("rev-parse", "main", cwd=fleet.repos[name]) for name in heads} == heads
+
+def test_failed_repositories_do_not_stop_the_others(fleet):
+    status, results = fleet(["broken", "missing", "changed"], "--no-state")
+
+    assert status == 1
+    assert results["broken"].stages["readme"] == (fleet_runner.FAILED, "update script exited with status 1")
+    assert results["missing"].stages["readme"][0] == fleet_runner.FAILED
+    assert results["missing"].stages["readme"][1].startswith("checkout: ")
+    assert results["changed"].stages["readme"][0] == fleet_runner.CHANGED
+    assert git("rev-list", "--count", "main", cwd=fleet.repos["broken"]) == "1"
+
+def test_timed_out_repository_is_stopped(fleet):
+    status, results = fleet(["slow", "changed"], "--no-state", "--timeout", "5", "--workers", "2")
+
+    assert status == 1
+    slow = results["slow"]
+    assert slow.stages["readme"][0] == fleet_runner.FAILED
+    assert slow.stages["readme"][1].startswith("timed out after 5s")
+    assert slow.seconds < 30
+    assert results["changed"].stages["readme"][0] == fleet_runner.CHANGED
+
+def test_state_skips_repositories_whose_inputs_are_unchanged(fleet):
+    fleet(["changed", "broken"])
+    status, results = fleet(["changed", "broken"])
+
+    assert status == 1
+    assert results["changed"].stages["readme"] == (fleet_runner.UNCHANGED, "inputs unchanged")
+    assert results["changed"].clone_seconds == 0.0
+    assert results["broken"].stages["readme"][0] == fleet_runner.FAILED
+
+    status, results = fleet(["changed"], "--force")
+    assert results["changed"].stages["readme"] == (fleet_runner.UNCHANGED, "README.md not changed")
+
+def test_portfolio_in_the_fleet_keeps_its_own_job_and_state(fleet, tmp_path, capsys):
+    status, results = fleet(["portfolio"], "--stages", "readme,html")
+
+    assert status == 0
+    assert results["portfolio"].stages["html"] == (fleet_runner.CHANGED, "pushed readme.html")
+    bare = fleet.repos["portfolio"]
+    assert git("log", "-1", "--format=%s", "main", cwd=bare) == "Automatic Update readme.html for all repositories"
+    assert "<h1" in git("show", f"main:{fleet_runner.PORTFOLIO_PARTIALS_DIR}/portfolio/readme.html", cwd=bare)
+    assert results["portfolio"].repo_sha == git("rev-parse", "main", cwd=bare)
+    assert (tmp_path / "logs" / "portfolio.log").read_text().startswith("$ git")
+    assert "git push" in (tmp_path / "logs" / "portfolio-portfolio.log").read_text()
+    assert "Section cache: 0 hits, 1 misses" in capsys.readouterr().out
+    assert len(list((tmp_path / "sections").iterdir())) == 1
+
+    status, results = fleet(["portfolio"], "--stages", "readme,html")
+    assert results["portfolio"].stages == {stage: (fleet_runner.UNCHANGED, "inputs unchanged") for stage in ("readme", "html")}
+
+def test_missing_converter_only_drops_the_html_stage(fleet, monkeypatch, capsys):
+    def build_artifact(artifact_dir):
+        raise OSError("no network")
+
+    def load_converter_module(name, path=None):
+        raise ImportError("No module named 'markdown'")
+
+    monkeypatch.setattr(fleet_runner.build_zipapp, "build_artifact", build_artifact)
+    monkeypatch.setattr(fleet_runner, "load_converter_module", load_converter_module)
+
+    status, results = fleet(["changed"], "--no-state", "--stages", "readme,html", zipapp=True)
+
+    assert status == 0
+    assert results["changed"].stages == {"readme": (fleet_runner.CHANGED, "pushed README.md")}
+    assert "Skipping the html stage" in capsys.readouterr().out
+
+    status, results = fleet(["changed"], "--no-state", "--stages", "html", zipapp=True)
+    assert (status, results) == (1, {})
+
+def test_converter_error_fails_only_that_repository(fleet, tmp_path):
+    status, results = fleet(["latin1", "portfolio"], "--stages", "readme,html")
+
+    assert status == 1
+    assert results["latin1"].stages["html"][0] == fleet_runner.FAILED
+    assert results["latin1"].stages["html"][1].startswith("UnicodeDecodeError: ")
+    assert "Traceback" in (tmp_path / "logs" / "latin1.log").read_text()
+    assert results["portfolio"].stages["html"] == (fleet_runner.CHANGED, "pushed readme.html")
+
+    # The failed repository is not recorded, so it runs again
+    status, results = fleet(["latin1", "portfolio"], "--stages", "readme,html")
+    assert results["latin1"].stages["html"][0] == fleet_runner.FAILED
+    assert results["portfolio"].stages["html"] == (fleet_runner.UNCHANGED, "inputs unchanged")
+
+def test_script_hiding_a_failed_render_is_not_recorded(fleet):
+    status, results = fleet(["hidden", "changed"])
+
+    assert status == 0
+    assert results["hidden"].stages["readme"] == (fleet_runner.UNCHANGED, "README.md not changed, no render seen")
+
+    status, results = fleet(["hidden", "changed"])
+    assert results["hidden"].stages["readme"] == (fleet_runner.UNCHANGED, "README.md not changed, no render seen")
+    assert results["hidden"].clone_seconds > 0
+    assert results["changed"].stages["readme"] == (fleet_runner.UNCHANGED, "inputs unchanged")
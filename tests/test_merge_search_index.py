@@ -0,0 +1,50 @@
+import convert_readme_to_html
+import merge_search_index
+
+READMES = {
+    "alpha": "Alpha intro\n\n## Install\n\nRun the installer with docker compose.\n\n## Usage\n\nStart the server.\n",
+    "beta": "## Setup\n\nConfigure nginx and docker.\n\n## Deploy\n\nPush to the server with Jenkins.\n",
+    "gamma": "## Overview\n\nA redis cache in front of postgres.\n",
+}
+
+def shard(name, text=None):
+    context = convert_readme_to_html.RepositoryContext(f"https://github.com/user/{name}", "main")
+    _, index = convert_readme_to_html.markdown_to_indexed_html(text or READMES[name], context)
+    return index
+
+# Function to list the (repository, section title) pairs a term's postings point at
+def lookup(merged, term):
+    return [(merged["sections"][posting[0]]["repository"], merged["sections"][posting[0]]["title"]) for posting in merged["terms"].get(term, [])]
+
+def test_merged_index_splits_back_into_its_shards():
+    shards = {name: shard(name) for name in READMES}
+
+    merged = merge_search_index.merge_shards(shards)
+
+    assert merged["repositories"] == ["alpha", "beta", "gamma"]
+    assert len(merged["sections"]) == sum(len(index["sections"]) for index in shards.values())
+    assert lookup(merged, "docker") == [("alpha", "Install"), ("beta", "Setup")]
+    assert lookup(merged, "server") == [("alpha", "Usage"), ("beta", "Deploy")]
+    assert merge_search_index.split_merged_index(merged) == shards
+
+def test_replacing_one_shard_keeps_the_others(tmp_path):
+    index_file = str(tmp_path / "search_index.json")
+    merge_search_index.write_index(merge_search_index.merge_shards({name: shard(name) for name in READMES}), index_file)
+
+    shards = merge_search_index.split_merged_index(merge_search_index.load_index(index_file))
+    shards["beta"] = shard("beta", "## Setup\n\nConfigure traefik.\n")
+    merge_search_index.write_index(merge_search_index.merge_shards(shards), index_file)
+    merged = merge_search_index.load_index(index_file)
+
+    assert merged == merge_search_index.merge_shards({"alpha": shard("alpha"), "beta": shard("beta", "## Setup\n\nConfigure traefik.\n"), "gamma": shard("gamma")})
+    assert lookup(merged, "docker") == [("alpha", "Install")]
+    assert lookup(merged, "traefik") == [("beta", "Setup")]
+    assert lookup(merged, "redis") == [("gamma", "Overview")]
+
+def test_unreadable_or_old_index_is_ignored(tmp_path):
+    (tmp_path / "broken.json").write_text("{")
+    (tmp_path / "old.json").write_text('{"version": 0, "sections": [], "terms": {}}')
+
+    assert merge_search_index.load_index(str(tmp_path / "broken.json")) is None
+    assert merge_search_index.load_index(str(tmp_path / "old.json")) is None
+    assert merge_search_index.load_index(str(tmp_path / "missing.json")) is None
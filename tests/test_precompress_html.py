@@ -0,0 +1,75 @@
+import gzip
+import json
+
+import pytest
+
+import convert_readme_to_html
+import precompress_html
+
+def signatures(directory):
+    return {path.name: (path.stat().st_ino, path.stat().st_mtime_ns) for path in directory.iterdir()}
+
+@pytest.fixture
+def html_file(tmp_path):
+    path = tmp_path / "readme.html"
+    path.write_text("<h1>Title</h1>\n" + "<p>Some text.</p>\n" * 200)
+    return path
+
+def test_precompress_writes_variants_and_manifest(html_file):
+    pytest.importorskip("brotli")
+    manifest = precompress_html.precompress(str(html_file))
+
+    assert sorted(manifest) == ["readme.html", "readme.html.br", "readme.html.gz"]
+    assert gzip.decompress((html_file.parent / "readme.html.gz").read_bytes()) == html_file.read_bytes()
+    for variant, entry in manifest.items():
+        assert (html_file.parent / variant).stat().st_size == entry["size"]
+        assert entry["etag"] == f'"{entry["sha256"][:32]}"'
+    assert json.loads((html_file.parent / "readme.html.manifest.json").read_text()) == manifest
+
+def test_unchanged_html_is_not_compressed_again(html_file, monkeypatch):
+    manifest = precompress_html.precompress(str(html_file))
+    written = signatures(html_file.parent)
+
+    def compress(*args, **kwargs):
+        raise AssertionError("compressed again")
+
+    monkeypatch.setattr(precompress_html.gzip, "compress", compress)
+    monkeypatch.setattr(precompress_html, "brotli_compress", compress)
+
+    assert precompress_html.precompress(str(html_file)) == manifest
+    assert signatures(html_file.parent) == written
+
+def test_changed_or_missing_artifacts_are_compressed_again(html_file):
+    first = precompress_html.precompress(str(html_file))
+
+    html_file.write_text("<h1>New title</h1>\n")
+    second = precompress_html.precompress(str(html_file))
+    assert second["readme.html"]["sha256"] != first["readme.html"]["sha256"]
+    assert gzip.decompress((html_file.parent / "readme.html.gz").read_bytes()) == b"<h1>New title</h1>\n"
+
+    (html_file.parent / "readme.html.gz").unlink()
+    assert precompress_html.precompress(str(html_file)) == second
+    assert (html_file.parent / "readme.html.gz").exists()
+
+def test_stale_brotli_variant_is_removed_without_brotli(html_file, monkeypatch):
+    pytest.importorskip("brotli")
+    precompress_html.precompress(str(html_file))
+    monkeypatch.setattr(precompress_html, "brotli_installed", lambda: False)
+    monkeypatch.setattr(precompress_html, "brotli_compress", lambda data: None)
+
+    manifest = precompress_html.precompress(str(html_file))
+
+    assert sorted(manifest) == ["readme.html", "readme.html.gz"]
+    assert not (html_file.parent / "readme.html.br").exists()
+
+def test_pages_that_are_gone_lose_their_precompressed_variants(tmp_path):
+    preamble, pages = convert_readme_to_html.markdown_to_pages("intro\n\n## Setup\n\nsetup\n\n## Usage\n\nusage\n")
+    for html_file in convert_readme_to_html.write_pages(preamble, pages, str(tmp_path)):
+        precompress_html.precompress(html_file)
+    assert (tmp_path / "usage.html.gz").exists()
+
+    preamble, pages = convert_readme_to_html.markdown_to_pages("intro\n\n## Setup\n\nsetup\n")
+    convert_readme_to_html.write_pages(preamble, pages, str(tmp_path))
+
+    assert not [path.name for path in tmp_path.iterdir() if path.name.startswith("usage.html")]
+    assert (tmp_path / "setup.html.gz").exists()
@@ -0,0 +1,222 @@
+import json
+import multiprocessing
+import subprocess
+import sys
+import time
+
+import pytest
+
+import readme_updater
+
+# Minimal stand-in for a requests response stored in the include cache
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+        self.headers = {"ETag": f'"{readme_updater.hash_text(text)}"'}
+
+def test_prefetch_fetches_includes_concurrently(stub_server):
+    stub = stub_server({f"/part_{index}.md": f"part {index}\n" for index in range(8)}, latency=0.2)
+    include_map = {f"PART {index}": f"{stub.url}/part_{index}.md" for index in range(8)}
+    session = readme_updater.create_session()
+    try:
+        start = time.perf_counter()
+        fetched = readme_updater.prefetch_includes(list(include_map), include_map, session, max_workers=8)
+        elapsed = time.perf_counter() - start
+    finally:
+        session.close()
+
+    assert fetched == {f"PART {index}": f"part {index}\n" for index in range(8)}
+    assert stub.max_in_flight > 1
+    assert elapsed < 8 * 0.2 / 2
+
+def test_prefetch_respects_worker_limit(stub_server):
+    stub = stub_server({f"/part_{index}.md": "part\n" for index in range(6)}, latency=0.05)
+    include_map = {f"PART {index}": f"{stub.url}/part_{index}.md" for index in range(6)}
+    session = readme_updater.create_session()
+    try:
+        readme_updater.prefetch_includes(list(include_map), include_map, session, max_workers=2)
+    finally:
+        session.close()
+
+    assert stub.max_in_flight <= 2
+
+def test_repeated_placeholders_are_fetched_once(stub_server):
+    stub = stub_server({"/doc.md": "doc [STACK]\n", "/stack.md": "stack\n"})
+    include_map = {
+        "DOC_AND_STACK": f"{stub.url}/doc.md",
+        "DOC_COPY": f"{stub.url}/doc.md",
+        "STACK": f"{stub.url}/stack.md",
+    }
+    base = "[DOC_AND_STACK]\n[STACK]\n[DOC_AND_STACK]\n[DOC_COPY]\n"
+
+    content = readme_updater.include_file_content(base, include_map)
+
+    assert content == "doc stack\n\n\nstack\n\ndoc stack\n\n\ndoc stack\n\n\n"
+    assert stub.requests == {"/doc.md": 1, "/stack.md": 1}
+
+def test_failed_requests_are_retried(stub_server):
+    stub = stub_server({"/flaky.md": "flaky\n"}, failures={"/flaky.md": 1})
+    include_map = {"FLAKY": f"{stub.url}/flaky.md"}
+
+    content = readme_updater.include_file_content("[FLAKY]", include_map)
+
+    assert content == "flaky\n"
+    assert stub.requests["/flaky.md"] == 2
+
+def test_include_failing_every_retry_stops_the_render(stub_server):
+    stub = stub_server({"/down.md": "down\n"}, failures={"/down.md": 10})
+    include_map = {"DOWN": f"{stub.url}/down.md"}
+    session = readme_updater.create_session(retries=1)
+    try:
+        content = readme_updater.include_file_content("[DOWN]", include_map, session)
+    finally:
+        session.close()
+
+    assert content is None
+    assert stub.requests["/down.md"] == 2
+
+def test_slow_server_times_out(stub_server):
+    stub = stub_server({"/slow.md": "slow\n"}, latency=1.0)
+    session = readme_updater.create_session(retries=0)
+    try:
+        with pytest.raises(FileNotFoundError):
+            readme_updater.fetch_content(f"{stub.url}/slow.md", session, timeout=0.2)
+    finally:
+        session.close()
+
+def test_cache_revalidates_with_conditional_get(stub_server, tmp_path):
+    stub = stub_server({"/doc.md": "doc\n"}, etags={"/doc.md": '"v1"'})
+    url = f"{stub.url}/doc.md"
+    session = readme_updater.create_session()
+    try:
+        first = readme_updater.IncludeCache(str(tmp_path))
+        assert readme_updater.fetch_source(url, session, cache=first) == ("doc\n", "remote")
+        first.save()
+
+        second = readme_updater.IncludeCache(str(tmp_path))
+        assert readme_updater.fetch_source(url, session, cache=second) == ("doc\n", "cache")
+    finally:
+        session.close()
+
+    assert (second.hits, second.revalidated, second.misses) == (0, 1, 0)
+    assert stub.requests["/doc.md"] == 2
+
+def test_cache_body_not_matching_its_entry_is_a_miss(tmp_path):
+    cache = readme_updater.IncludeCache(str(tmp_path))
+    cache.store("http://example.com/doc.md", FakeResponse("doc\n"))
+    with open(cache.body_path("http://example.com/doc.md"), "w") as body_file:
+        body_file.write("stored by another process\n")
+
+    assert cache.lookup("http://example.com/doc.md") == (None, None)
+
+def save_entries(cache_dir, worker, count):
+    for index in range(count):
+        cache = readme_updater.IncludeCache(cache_dir)
+        cache.store(f"http://example.com/{worker}/{index}.md", FakeResponse(f"worker {worker} include {index}\n"))
+        cache.save()
+
+def test_cache_saves_from_concurrent_processes_are_merged(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=save_entries, args=(str(tmp_path), worker, 50)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+    assert [process.exitcode for process in workers] == [0, 0, 0, 0]
+    cache = readme_updater.IncludeCache(str(tmp_path))
+    assert len(cache.entries) == 200
+    entry, body = cache.lookup("http://example.com/3/49.md")
+    assert body == "worker 3 include 49\n"
+
+def test_profile_records_longest_nesting_depth(tmp_path):
+    for name, content in {"a.md": "a [B]\n", "b.md": "b [C]\n", "c.md": "c\n"}.items():
+        (tmp_path / name).write_text(content)
+    include_map = {key: str(tmp_path / f"{key.lower()}.md") for key in ("A", "B", "C")}
+    profile = readme_updater.RenderProfile()
+
+    readme_updater.resolve_includes("[A] [B]\n", include_map, profile=profile)
+
+    records = {record["placeholder"]: record for record in profile.records if record["event"] == "include"}
+    assert {key: (record["iteration"], record["depth"]) for key, record in records.items()} == {
+        "A": (0, 1), "B": (0, 2), "C": (1, 3),
+    }
+
+def test_profile_depths_of_project_slots_count_from_the_base_readme(tmp_path):
+    manager_dir = tmp_path / "project" / readme_updater.PROJECT_MANAGER_DIR
+    manager_dir.mkdir(parents=True)
+    (manager_dir / "intro.md").write_text("intro\n")
+    (tmp_path / "common.md").write_text("common [INTRO]\n")
+    include_map = {"COMMON": str(tmp_path / "common.md"), "INTRO": "intro.md"}
+    template = readme_updater.compile_template("[COMMON]\n", include_map, {"INTRO"})
+    profile = readme_updater.RenderProfile()
+
+    readme_updater.resolve_render("[COMMON]\n", include_map, str(tmp_path / "project"), template=template, profile=profile)
+
+    assert [(record["placeholder"], record["depth"]) for record in profile.records] == [("INTRO", 2)]
+
+def test_profile_on_stdout_keeps_progress_messages_on_stderr(tmp_path):
+    completed = subprocess.run(
+        [sys.executable, readme_updater.__file__, str(tmp_path), "--profile", "-", "--cache-only", "--cache-dir", str(tmp_path / "cache")],
+        capture_output=True, text=True,
+    )
+
+    assert completed.returncode == readme_updater.FAILED_EXIT_CODE
+    assert "Fetching content from" in completed.stderr
+    records = [json.loads(line) for line in completed.stdout.splitlines()]
+    assert records[-1]["phase"] == "total"
+
+def test_lock_manifest_statuses_the_fleet_relies_on(stub_server, tmp_path):
+    stub = stub_server({"/common.md": "common v1\n"})
+    include_map = {"COMMON": f"{stub.url}/common.md", "INTRO": "partials/intro.md"}
+    (tmp_path / "readme_manager" / "partials").mkdir(parents=True)
+    (tmp_path / "readme_manager" / "partials" / "intro.md").write_text("intro\n")
+    base = "# Project\n[INTRO]\n[COMMON]\n"
+    readme_file = tmp_path / "README.md"
+    manifest_file = tmp_path / "readme_manager" / readme_updater.LOCK_MANIFEST_NAME
+    session = readme_updater.create_session(retries=0)
+
+    def update(force=False):
+        return readme_updater.update_project_readme(base, include_map, str(tmp_path), session, force=force)
+
+    try:
+        assert update() == 0
+        assert readme_file.read_text() == "# Project\nintro\n\ncommon v1\n\n"
+        assert json.loads(manifest_file.read_text())["output"] == readme_updater.hash_text(readme_file.read_text())
+
+        # A rerun with the same inputs leaves README.md alone
+        written = readme_file.stat().st_mtime_ns
+        assert update() == readme_updater.UNCHANGED_EXIT_CODE
+        assert readme_file.stat().st_mtime_ns == written
+
+        # A changed include renders again
+        stub.documents["/common.md"] = "common v2\n"
+        assert update() == 0
+        assert "common v2" in readme_file.read_text()
+        assert update() == readme_updater.UNCHANGED_EXIT_CODE
+
+        # So does a hand edit of README.md, and --force
+        readme_file.write_text("edited\n")
+        assert update() == 0
+        assert update(force=True) == 0
+        assert update() == readme_updater.UNCHANGED_EXIT_CODE
+    finally:
+        session.close()
+    assert stub.requests["/common.md"] == 7
+
+def test_run_returns_explicit_exit_codes(stub_server, tmp_path, monkeypatch, capsys):
+    stub = stub_server({"/common.md": "common\n"})
+    monkeypatch.setattr(readme_updater, "include_files", {"COMMON": f"{stub.url}/common.md"})
+    monkeypatch.setattr(readme_updater, "read_base_readme", lambda: "# Project\n[COMMON]\n")
+    (tmp_path / "readme_manager").mkdir()
+    template_file = str(tmp_path / "template.json")
+
+    def run(*argv):
+        return readme_updater.main([str(tmp_path), "--no-cache"] + list(argv))
+
+    assert run() == 0
+    assert run() == readme_updater.UNCHANGED_EXIT_CODE
+    assert run("--force") == 0
+    assert run("--compile-template", template_file) == 0
+    stub.documents.clear()
+    assert run("--force") == readme_updater.FAILED_EXIT_CODE
@@ -60,18 +60,27 @@ update_readme() {
     if [ -f "$UPDATE_SCRIPT_PATH" ]; then
         echo "Running update script: $UPDATE_SCRIPT_PATH"
         bash "$UPDATE_SCRIPT_PATH"
+        UPDATE_STATUS=$?
 
+        # Exit status 3 means the lock manifest matched and README.md was left untouched. Only
+        # update_readme.sh scripts that end with the renderer's status pass it on (see
+        # readme_manager.md); with older ones every run goes through the diff below
+        if [ "$UPDATE_STATUS" -eq 3 ]; then
+            echo "README.md not changed for $repo_name (lock manifest up to date)"
         # Check if README.md was created or updated
-        if [ -f "README.md" ]; then
-            # Stage the README.md file
+        elif [ -f "README.md" ]; then
+            # Stage the README.md file and the lock manifest describing how it was rendered
             git add README.md
+            if [ -f "readme_manager/readme.lock.json" ]; then
+                git add readme_manager/readme.lock.json
+            fi
 
             # Print the difference detected
             echo "Checking differences for README.md"
-            git --no-pager diff --cached README.md
+            git --no-pager diff --cached README.md readme_manager/readme.lock.json
 
             # Check if there are any differences between the working directory and the index
-            if git diff --cached --exit-code README.md; then
+            if git diff --cached --quiet; then
                 echo "README.md not changed for $repo_name"
             else
                 # Commit and push the changes
@@ -25,6 +25,17 @@ EOF
 # Directory where the script is located
 SCRIPT_DIR=$(pwd)
 
+# Directory collecting each repository's readme.html and its precompressed variants
+ARTIFACTS_DIR="$SCRIPT_DIR/html_artifacts"
+
+# Function to print the sha256 recorded for an artifact in a precompression manifest, empty if absent
+artifact_hash() {
+    local manifest=$1
+    local artifact=$2
+    [ -f "$manifest" ] || return
+    python3 -c 'import json, sys; print(json.load(open(sys.argv[1])).get(sys.argv[2], {}).get("sha256", ""))' "$manifest" "$artifact"
+}
+
 # Function to update README.md for each repository
 process_repo() {
     local repo_url=$1
@@ -71,8 +82,14 @@ process_repo() {
 
         # Check if readme.html was created or updated
         if [ -f "readme_manager_html_detailed/readme.html" ]; then
-            # Copy readme.html to the script directory for later use
-            cp "readme_manager_html_detailed/readme.html" "$SCRIPT_DIR/readme_${repo_name}.html"
+            # Copy readme.html to the artifacts directory for later use
+            mkdir -p "$ARTIFACTS_DIR/$repo_name"
+            cp "readme_manager_html_detailed/readme.html" "$ARTIFACTS_DIR/$repo_name/readme.html"
+
+            # Collect the search index shard too, if the conversion wrote one (--search-index)
+            if [ -f "readme_manager_html_detailed/search_index.json" ]; then
+                cp "readme_manager_html_detailed/search_index.json" "$ARTIFACTS_DIR/$repo_name/search_index.json"
+            fi
         else
             echo "readme.html not found after running update script for $repo_name"
         fi
@@ -123,16 +140,40 @@ update_arpansahu_repo() {
     # Navigate to the repository directory
     cd "$repo_arpansahu_name" || { echo "Failed to navigate to repository directory: $repo_arpansahu_name"; return; }
 
-    # Copy all collected readme.html files to the appropriate location
-    for readme_file in "$SCRIPT_DIR"/readme_*.html; do
-        repo_name=$(basename "$readme_file" .html | sed 's/^readme_//')
-        echo "Copying $readme_file to $repo_arpansahu_name/templates/modules/project_detailed/project_partials/$repo_name/readme.html"
-        mkdir -p "templates/modules/project_detailed/project_partials/$repo_name"
-        cp "$readme_file" "templates/modules/project_detailed/project_partials/$repo_name/readme.html"
+    # Precompress every collected readme.html and copy over only the artifacts whose hash changed
+    for artifact_dir in "$ARTIFACTS_DIR"/*/; do
+        [ -f "$artifact_dir/readme.html" ] || continue
+        repo_name=$(basename "$artifact_dir")
+        target_dir="templates/modules/project_detailed/project_partials/$repo_name"
+        python3 "$SCRIPT_DIR/readme_manager_html_detailed/precompress_html.py" "$artifact_dir/readme.html"
+        mkdir -p "$target_dir"
+
+        for artifact in readme.html readme.html.gz readme.html.br; do
+            new_hash=$(artifact_hash "$artifact_dir/readme.html.manifest.json" "$artifact")
+            if [ -z "$new_hash" ]; then
+                # Not produced this time (e.g. brotli missing), so an old copy would be stale
+                rm -f "$target_dir/$artifact"
+            elif [ -f "$target_dir/$artifact" ] && [ "$new_hash" == "$(artifact_hash "$target_dir/readme.html.manifest.json" "$artifact")" ]; then
+                echo "Unchanged: $target_dir/$artifact"
+            else
+                echo "Copying $artifact to $repo_arpansahu_name/$target_dir/$artifact"
+                cp "$artifact_dir/$artifact" "$target_dir/$artifact"
+            fi
+        done
+        cp "$artifact_dir/readme.html.manifest.json" "$target_dir/readme.html.manifest.json"
     done
 
+    # Merge the collected search index shards into the site's single search index,
+    # keeping the repositories that were not processed in this run
+    local search_index="templates/modules/project_detailed/project_partials/search_index.json"
+    local shards=("$ARTIFACTS_DIR"/*/search_index.json)
+    if [ -f "${shards[0]}" ]; then
+        python3 "$SCRIPT_DIR/readme_manager_html_detailed/merge_search_index.py" "$search_index" "${shards[@]}"
+        git add "$search_index"
+    fi
+
     # Stage all changes
-    git add templates/modules/project_detailed/project_partials/*/readme.html
+    git add -A 'templates/modules/project_detailed/project_partials/*/readme.html*'
 
     echo "Checking differences for readme.html files"
     git --no-pager diff --cached
@@ -178,6 +219,9 @@ main() {
     # Determine the specific repository to update if provided, else update all
     SPECIFIC_REPO=$2
 
+    # Start from an empty artifacts directory
+    rm -rf "$ARTIFACTS_DIR"
+
     # Iterate over the list of repositories and process each one
     for repo in "${REPOS[@]}"; do
         if [ -z "$SPECIFIC_REPO" ] || [ "$repo" == "$SPECIFIC_REPO" ]; then
@@ -188,8 +232,8 @@ main() {
     # Update the arpansahu_dot_me repository with all collected readme.html files
     update_arpansahu_repo
 
-    # Clean up temporary readme.html files
-    rm -f "$SCRIPT_DIR"/readme_*.html
+    # Clean up the collected artifacts
+    rm -rf "$ARTIFACTS_DIR"
 }
 
 # Execute the main function with provided arguments or default to prod environment and all repositories